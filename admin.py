@@ -0,0 +1,79 @@
+"""
+Commands reserved for the bot's maintainers.
+Admins are identified by the comma-separated Telegram user IDs in the ADMIN_IDS environment variable.
+"""
+
+import os
+import threading
+from functools import wraps
+from admission import admission
+from analytics import stats
+from banks import registry, DEFAULT_BANK
+from profiling import run_profile, DEFAULT_SECS, MAX_SECS
+from telegram import Update
+from telegram.ext import CallbackContext
+
+ADMIN_IDS = {int(user_id) for user_id in os.environ.get("ADMIN_IDS", "").split(",") if user_id.strip()}
+
+
+def admin_only(callback):
+    """Decorator which silently ignores the command unless it comes from an admin"""
+    @wraps(callback)
+    def wrapper(update: Update, context: CallbackContext):
+        if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+            return
+        return callback(update, context)
+    return wrapper
+
+
+@admin_only
+def show_stats(update: Update, context: CallbackContext):
+    """Shows the live game statistics, or those of a single answer word (and optionally its bank) if one is given"""
+    if context.args:
+        bank_name = context.args[1].lower() if len(context.args) > 1 else DEFAULT_BANK
+        if not registry.exists(bank_name):
+            update.message.reply_text(f"There is no word bank called {bank_name}.")
+            return
+
+        bank = registry.acquire(bank_name)
+        try:
+            update.message.reply_text(stats.word_summary(bank, context.args[0].upper()))
+        finally:
+            registry.release(bank)
+    else:
+        update.message.reply_text(stats.summary())
+
+
+@admin_only
+def show_api_stats(update: Update, context: CallbackContext):
+    """Shows latency histograms for each Bot API method called so far"""
+    latency = getattr(context.bot.request, "latency", None)
+    if latency is None:
+        update.message.reply_text("API latency is not being recorded.")
+        return
+    update.message.reply_text(latency.summary())
+
+
+@admin_only
+def profile(update: Update, context: CallbackContext):
+    """Profiles the live process for the given number of seconds and replies with the hottest code paths"""
+    try:
+        seconds = int(context.args[0]) if context.args else DEFAULT_SECS
+    except ValueError:
+        update.message.reply_text("Usage: /profile [seconds]")
+        return
+
+    seconds = max(1, min(seconds, MAX_SECS))
+    update.message.reply_text(f"Profiling for {seconds} seconds...")
+
+    # Sample from a separate thread so that the dispatcher worker is free to keep handling updates
+    threading.Thread(target=run_profile, args=(update.effective_chat.id, seconds, context.bot),
+                     name="profiler", daemon=True).start()
+
+
+def show_load(bot_manager):
+    """Creates the command showing the admission controller's view of how loaded the bot is"""
+    @admin_only
+    def callback(update: Update, context: CallbackContext):
+        update.message.reply_text(admission.summary(len(bot_manager.waiting_lobbies)))
+    return callback
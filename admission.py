@@ -0,0 +1,89 @@
+"""
+Admission control and load shedding.
+Load is measured from the dispatcher's queue of unhandled updates, the number of outbound API calls in flight
+and the number of players in running games. New lobbies are queued or turned away when the bot is saturated,
+and non-essential messages are dropped under pressure so that replies to guesses stay fast.
+"""
+
+import os
+
+MAX_QUEUED_UPDATES = int(os.environ.get("MAX_QUEUED_UPDATES", "100"))
+MAX_OUTBOUND = int(os.environ.get("MAX_OUTBOUND", "32"))
+
+# The async outbox queues sends instead of holding a worker for each, so its backlog is much deeper in normal play
+# (beginning one 8-player game queues about 24 sends) and has its own limit
+MAX_OUTBOX = int(os.environ.get("MAX_OUTBOX", "500"))
+MAX_ACTIVE_PLAYERS = int(os.environ.get("MAX_ACTIVE_PLAYERS", "400"))
+MAX_WAITING_LOBBIES = int(os.environ.get("MAX_WAITING_LOBBIES", "20"))
+
+# Pressure is the highest of the load ratios above, where 1 means at capacity
+QUEUE_PRESSURE = 1.0
+REJECT_PRESSURE = 1.5
+SHED_START_PRESSURE = 0.8
+SHED_STOP_PRESSURE = 0.6
+ADMIT_INTERVAL = 10
+
+
+class AdmissionController:
+    """Tracks how loaded the bot is and decides whether new games may start"""
+    def __init__(self):
+        self.dispatcher = self.request = None
+        self.max_outbound = MAX_OUTBOUND
+        self.active_players = 0
+        self.is_shedding = False
+        self.shed_count = 0
+
+    def attach(self, dispatcher, request, max_outbound=MAX_OUTBOUND):
+        """Gives the controller access to the dispatcher's update queue and the transport's (or outbox's) in-flight calls"""
+        self.dispatcher = dispatcher
+        self.request = request
+        self.max_outbound = max_outbound
+
+    def queued_updates(self):
+        return self.dispatcher.update_queue.qsize() if self.dispatcher else 0
+
+    def outbound(self):
+        # The threaded transport counts calls in flight in its latency recorder, the async outbox counts its backlog
+        counter = getattr(self.request, "latency", self.request)
+        return getattr(counter, "in_flight", 0)
+
+    def pressure(self):
+        return max(self.queued_updates() / MAX_QUEUED_UPDATES,
+                   self.outbound() / self.max_outbound,
+                   self.active_players / MAX_ACTIVE_PLAYERS)
+
+    def admit(self):
+        """Returns "accept", "queue" or "reject" for a new lobby, depending on the current pressure"""
+        pressure = self.pressure()
+        if pressure < QUEUE_PRESSURE:
+            return "accept"
+        if pressure < REJECT_PRESSURE:
+            return "queue"
+        return "reject"
+
+    def shedding(self):
+        """Whether non-essential messages should be dropped, with hysteresis so it doesn't flap"""
+        pressure = self.pressure()
+        if self.is_shedding and pressure < SHED_STOP_PRESSURE:
+            self.is_shedding = False
+        elif not self.is_shedding and pressure >= SHED_START_PRESSURE:
+            self.is_shedding = True
+        return self.is_shedding
+
+    def shed(self):
+        """Returns True (and counts the dropped message) if a non-essential message should be skipped"""
+        if self.shedding():
+            self.shed_count += 1
+            return True
+        return False
+
+    def summary(self, waiting_lobbies):
+        return f"Pressure: {self.pressure():.2f}{' (shedding)' if self.is_shedding else ''}\n" \
+               f"Queued updates: {self.queued_updates()}/{MAX_QUEUED_UPDATES}\n" \
+               f"Outbound calls in flight: {self.outbound()}/{self.max_outbound}\n" \
+               f"Active players: {self.active_players}/{MAX_ACTIVE_PLAYERS}\n" \
+               f"Waiting lobbies: {waiting_lobbies}/{MAX_WAITING_LOBBIES}\n" \
+               f"Messages shed: {self.shed_count}"
+
+
+admission = AdmissionController()
@@ -0,0 +1,595 @@
+"""
+Asyncio-native mode of the bot (ASYNC_MODE=1).
+Every handler and timer runs on a single event loop instead of the dispatcher thread, its worker pool and
+APScheduler's threads. The game code itself is shared with the threaded mode and never waits on the network:
+sends are queued and delivered by per-chat tasks, and the group memberships that matching_group looks up are
+fetched concurrently before an update is dispatched. Bot API calls and the webhook go through aiohttp, whose
+keep-alive connection pool lets thousands of games share a few connections without any threads.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+import aiohttp
+from aiohttp import web
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from telegram import TelegramObject, Update, User
+from telegram.error import (BadRequest, ChatMigrated, NetworkError, RetryAfter, TelegramError, TimedOut,
+                            Unauthorized)
+from telegram.ext import CallbackContext, Dispatcher
+from telegram.utils.helpers import DefaultValue
+from drain import Drainer, DRAIN_TIMEOUT, IDLE_CHECK_INTERVAL
+from multiplayer import link_group
+from transport import (FakeRequest, LatencyHistogram, LatencyRecorder, METHOD_TIMEOUTS, CONNECT_TIMEOUT, READ_TIMEOUT,
+                       FAKE_LATENCY_MS, FAKE_TOKEN)
+
+# Connections cost no threads here, so the pool can be much larger than the threaded transport's
+POOL_SIZE = int(os.environ.get("ASYNC_POOL_SIZE", "100"))
+API_URL = "https://api.telegram.org"
+POLL_TIMEOUT = 25
+MEMBER_TTL = 300
+NOT_MEMBER_TTL = 30
+MEMBER_CACHE_SIZE = 50000
+LOOKUP_BATCH = 32
+SEND_RETRIES = 3
+
+# Arguments PTB passes to Bot methods which aren't part of the API call
+LOCAL_ARGS = {"timeout", "api_kwargs"}
+
+# Commands whose handlers find their game through BotManager.matching_group
+MATCHED_COMMANDS = {"/players", "/begin", "/end"}
+
+logger = logging.getLogger(__name__)
+
+
+# ----------- TRANSPORT ----------
+
+class AsyncTransport:
+    """Bot API client over an aiohttp keep-alive connection pool, with per-method timeouts and latency histograms"""
+    def __init__(self, token, pool_size=POOL_SIZE, base_url=API_URL, method_timeouts=None):
+        self.token = token
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.method_timeouts = {**METHOD_TIMEOUTS, **(method_timeouts or {})}
+        self.slots = asyncio.Semaphore(pool_size)
+        self.session = None
+        self.latency = LatencyRecorder()
+
+        # Callables notified with (method, data, result) after every successful call
+        self.listeners = []
+
+    async def call(self, method, data, timeout=None):
+        """Makes an API call, returning its result or raising the matching telegram.error exception"""
+        if timeout is None:
+            timeout = self.method_timeouts.get(method, READ_TIMEOUT)
+
+        start = self.latency.start(method)
+        try:
+            async with self.slots:
+                result = await self.post(method, data, timeout)
+        except asyncio.TimeoutError:
+            raise TimedOut()
+        except aiohttp.ClientError as error:
+            raise NetworkError(f"{type(error).__name__}: {error}")
+        finally:
+            self.latency.finish(method, start)
+
+        for listener in self.listeners:
+            listener(method, data, result)
+        return result
+
+    async def post(self, method, data, timeout):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+
+        client_timeout = aiohttp.ClientTimeout(total=CONNECT_TIMEOUT + timeout, connect=CONNECT_TIMEOUT)
+        async with self.session.post(f"{self.base_url}/bot{self.token}/{method}", json=data,
+                                     timeout=client_timeout) as response:
+            # The body is always read in full, so the connection goes back to the pool in a clean state
+            payload = await response.read()
+        return parse_result(response.status, payload)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class FakeAsyncTransport(AsyncTransport):
+    """In-process stand-in for the Bot API, answering calls the way FakeRequest does after a simulated delay"""
+    def __init__(self, latency_ms=FAKE_LATENCY_MS, **kwargs):
+        super().__init__(FAKE_TOKEN, **kwargs)
+        self.latency_ms = latency_ms
+        self.api = FakeRequest(latency_ms=0)
+        self.calls = self.api.calls
+        self.sent = self.api.sent
+        self.updates = asyncio.Queue()
+
+    def push_update(self, update: dict):
+        """Queues an update for getUpdates, remembering which users have been seen in which group chats"""
+        message = update.get("message")
+        if message and message["chat"]["type"] != "private" and "from" in message:
+            self.api.add_member(message["chat"]["id"], message["from"]["id"])
+        self.updates.put_nowait(update)
+
+    def add_member(self, chat_id, user_id):
+        self.api.add_member(chat_id, user_id)
+
+    async def post(self, method, data, timeout):
+        # Simulated network latency, so the pool and the per-chat senders can be benchmarked
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        # Round trip through JSON like the real transport, so unserialisable arguments are caught here too
+        data = json.loads(json.dumps(data))
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self.fake_getUpdates(data)
+        handler = getattr(self.api, f"fake_{method}", None)
+        return handler(data) if handler else True
+
+    async def fake_getUpdates(self, data):
+        try:
+            updates = [await asyncio.wait_for(self.updates.get(), float(data.get("timeout", 0)) or 0.1)]
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return [update for update in updates if update.get("update_id", 0) >= int(data.get("offset", 0))]
+
+    async def close(self):
+        pass
+
+
+def make_transport(token):
+    """Creates the transport that the async bot will send all API calls through"""
+    return AsyncTransport(token)
+
+
+# ----------- QUEUES ----------
+
+class KeyedQueues:
+    """Runs items through an async worker in order for each key, with different keys running concurrently"""
+    def __init__(self, worker):
+        self.worker = worker
+        self.queues = {}
+        self.tasks = set()
+        self.pending = 0
+
+    def put(self, key, item):
+        self.pending += 1
+        if key in self.queues:
+            self.queues[key].append(item)
+            return
+
+        self.queues[key] = deque([item])
+        task = asyncio.create_task(self.process(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def process(self, key):
+        items = self.queues[key]
+        try:
+            while items:
+                try:
+                    await self.worker(key, items.popleft())
+                except Exception:
+                    logger.exception("Error while processing an item for %s", key)
+                finally:
+                    self.pending -= 1
+        finally:
+            del self.queues[key]
+
+    # Queue-like interface, so admission control and draining can read the backlog
+    def qsize(self):
+        return self.pending
+
+    def empty(self):
+        return self.pending == 0
+
+
+class Outbox:
+    """Delivers queued API calls in order for each chat, with different chats sent to concurrently"""
+    def __init__(self, transport):
+        self.transport = transport
+        self.queues = KeyedQueues(self.deliver)
+        self.delivery = LatencyHistogram()
+        self.loop = None
+
+    @property
+    def in_flight(self):
+        return self.queues.pending
+
+    def send(self, method, data):
+        """Queues a call, from the loop or (for the profiler's replies) from another thread"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop.call_soon_threadsafe(self.send, method, data)
+            return
+        self.queues.put(data["chat_id"], (method, data, time.perf_counter()))
+
+    async def deliver(self, chat_id, item):
+        method, data, queued = item
+        for attempt in range(SEND_RETRIES):
+            try:
+                await self.transport.call(method, data)
+                break
+            except RetryAfter as error:
+                await asyncio.sleep(error.retry_after)
+            except TelegramError as error:
+                logger.warning('Sending %s to %s failed with "%s"', method, chat_id, error)
+                break
+        self.delivery.record((time.perf_counter() - queued) * 1000)
+
+    def empty(self):
+        return self.queues.empty()
+
+
+# ----------- BOT ----------
+
+class MembershipCache:
+    """Group memberships looked up ahead of dispatching, so that matching_group never waits on the API"""
+    def __init__(self, transport):
+        self.transport = transport
+        self.known = OrderedDict()
+
+    def remember(self, chat_id, user_id, is_member):
+        self.known[(chat_id, user_id)] = (is_member, time.monotonic() + (MEMBER_TTL if is_member else NOT_MEMBER_TTL))
+        self.known.move_to_end((chat_id, user_id))
+        if len(self.known) > MEMBER_CACHE_SIZE:
+            self.known.popitem(last=False)
+
+    def lookup_cached(self, chat_id, user_id):
+        """Returns True or False if the membership is known and fresh, otherwise None"""
+        entry = self.known.get((chat_id, user_id))
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    async def lookup(self, chat_id, user_id):
+        cached = self.lookup_cached(chat_id, user_id)
+        if cached is not None:
+            return cached
+        try:
+            await self.transport.call("getChatMember", {"chat_id": chat_id, "user_id": user_id})
+            is_member = True
+        except BadRequest:
+            is_member = False
+        except TelegramError:
+            return False
+        self.remember(chat_id, user_id, is_member)
+        return is_member
+
+    async def find(self, chat_ids, user_id):
+        """Looks up the user in each chat, a batch at a time and in order, stopping at the first they belong to"""
+        for i in range(0, len(chat_ids), LOOKUP_BATCH):
+            batch = chat_ids[i:i + LOOKUP_BATCH]
+            if any(await asyncio.gather(*(self.lookup(chat_id, user_id) for chat_id in batch))):
+                return
+
+
+class AsyncBot:
+    """Stands in for telegram.Bot in handlers, queueing sends on the outbox instead of making them"""
+    defaults = None
+
+    def __init__(self, transport, outbox, members):
+        self.request = transport
+        self.outbox = outbox
+        self.members = members
+        self.bot = None
+
+    @property
+    def username(self):
+        return self.bot.username
+
+    @property
+    def id(self):
+        return self.bot.id
+
+    def send_message(self, chat_id, text, **kwargs):
+        data = {"chat_id": chat_id, "text": text}
+        for key, value in kwargs.items():
+            if value is not None and key not in LOCAL_ARGS and not isinstance(value, DefaultValue):
+                data[key] = to_api(value)
+        self.outbox.send("sendMessage", data)
+
+    def get_chat_member(self, chat_id, user_id, **kwargs):
+        """Answers from the membership cache, filled in by the runner before the update was dispatched"""
+        if not self.members.lookup_cached(chat_id, user_id):
+            raise BadRequest("User not found")
+        return True
+
+
+# ----------- JOB QUEUE ----------
+
+class LoopJob:
+    """Stand-in for telegram.ext.Job that is scheduled with loop.call_later"""
+    def __init__(self, job_queue, callback, interval, context, name):
+        self.job_queue = job_queue
+        self.callback = callback
+        self.interval = interval
+        self.context = context
+        self.name = name or callback.__name__
+        self.when = None
+        self.handle = None
+        self.removed = False
+
+    @property
+    def next_t(self):
+        if self.removed or self.when is None:
+            return None
+        return datetime.now(timezone.utc) + timedelta(seconds=self.when - self.job_queue.loop.time())
+
+    def arm(self, delay):
+        loop = self.job_queue.loop
+        self.when = loop.time() + delay
+        self.handle = loop.call_at(self.when, self.job_queue.run_job, self)
+
+    def schedule_removal(self):
+        if self.removed:
+            return
+        self.removed = True
+        if self.handle is not None:
+            self.handle.cancel()
+        self.job_queue.forget(self)
+
+
+class LoopJobQueue:
+    """Implements the parts of telegram.ext.JobQueue the bot uses on the event loop, so timers need no threads"""
+    def __init__(self):
+        self.loop = None
+        self.dispatcher = None
+        self.named = {}
+
+    def set_dispatcher(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def start(self, loop):
+        self.loop = loop
+
+    def _schedule(self, callback, first, interval, context, name):
+        job = LoopJob(self, callback, interval, context, name)
+        self.named.setdefault(job.name, []).append(job)
+        job.arm(first)
+        return job
+
+    def run_once(self, callback, when, context=None, name=None, **kwargs):
+        return self._schedule(callback, when, None, context, name)
+
+    def run_repeating(self, callback, interval, first=None, context=None, name=None, **kwargs):
+        return self._schedule(callback, interval if first is None else first, interval, context, name)
+
+    def jobs(self):
+        return tuple(job for jobs in self.named.values() for job in jobs)
+
+    def get_jobs_by_name(self, name):
+        return tuple(self.named.get(name, ()))
+
+    def forget(self, job):
+        jobs = self.named.get(job.name, [])
+        if job in jobs:
+            jobs.remove(job)
+        if not jobs:
+            self.named.pop(job.name, None)
+
+    def run_job(self, job):
+        if job.removed:
+            return
+
+        # Re-arm repeating jobs first, so a callback cancelling its own job also cancels the next run
+        if job.interval is None:
+            job.schedule_removal()
+        else:
+            job.arm(job.interval)
+
+        try:
+            job.callback(CallbackContext.from_job(job, self.dispatcher))
+        except Exception as error:
+            self.dispatcher.dispatch_error(None, error)
+
+    def stop(self):
+        for job in self.jobs():
+            job.schedule_removal()
+
+
+# ----------- RUNNER ----------
+
+class AsyncRunner:
+    """Runs the bot's dispatcher, handlers and timers on one event loop"""
+    def __init__(self, transport, bot_manager):
+        self.transport = transport
+        self.bot_manager = bot_manager
+        self.outbox = Outbox(transport)
+        self.members = MembershipCache(transport)
+        self.bot = AsyncBot(transport, self.outbox, self.members)
+
+        # Updates are handled in order for each chat, with different chats handled concurrently
+        self.inbox = KeyedQueues(self.handle)
+        self.job_queue = LoopJobQueue()
+        self.dispatcher = Dispatcher(self.bot, self.inbox, job_queue=self.job_queue)
+        self.job_queue.set_dispatcher(self.dispatcher)
+
+        self.drainer = Drainer(self, bot_manager)
+        self.server = self.poller = None
+        self.stopped = None
+
+    async def start(self):
+        """Binds the runner to the running loop and fetches the bot's own user"""
+        loop = asyncio.get_running_loop()
+        self.job_queue.start(loop)
+        self.outbox.loop = loop
+        self.stopped = asyncio.Event()
+        self.bot.bot = User.de_json(await self.transport.call("getMe", {}), self.bot)
+
+    def receive(self, data: dict):
+        """Queues a raw update from getUpdates or the webhook"""
+        update = Update.de_json(data, self.bot)
+        chat = update.effective_chat
+        self.inbox.put(chat.id if chat else None, update)
+
+    async def handle(self, chat_id, update: Update):
+        """Fetches the memberships the update's handlers will look up, then dispatches it"""
+        await self.prefetch(update)
+        self.dispatcher.process_update(update)
+
+    async def prefetch(self, update: Update):
+        chat, user = update.effective_chat, update.effective_user
+        if chat is None or user is None:
+            return
+
+        # Anyone posting in a group is a member of it
+        if chat.type != "private":
+            self.members.remember(chat.id, user.id, True)
+            return
+
+        # Guesses are routed by BotManager's player index, so only joins and commands search the games.
+        # A Join button names its group, otherwise each game's group is checked in the order matching_group would.
+        query = update.callback_query
+        if query is not None and link_group(query.data) is not None:
+            group_ids = [link_group(query.data)]
+        elif query is not None or (update.message and (update.message.text or "").split("@")[0] in MATCHED_COMMANDS):
+            group_ids = [game_manager.group_chat_id for game_manager in self.bot_manager.game_managers
+                         if game_manager.group_chat_id is not None]
+        else:
+            return
+        await self.members.find(group_ids, chat.id)
+
+    # ----------- UPDATE SOURCES ----------
+
+    async def poll(self):
+        """Long-polls getUpdates until the runner stops"""
+        offset = 0
+        while not self.stopped.is_set():
+            try:
+                updates = await self.transport.call("getUpdates", {"offset": offset, "timeout": POLL_TIMEOUT},
+                                                    timeout=POLL_TIMEOUT + READ_TIMEOUT)
+            except TelegramError as error:
+                logger.warning('Polling failed with "%s"', error)
+                await asyncio.sleep(1)
+                continue
+            for data in updates:
+                offset = data["update_id"] + 1
+                self.receive(data)
+
+    async def start_webhook(self, port, url_path, webhook_url):
+        """Serves the webhook over plain HTTP (Heroku's router terminates TLS) and registers it with Telegram"""
+        async def receive_update(request: web.Request):
+            # Telegram re-delivers updates that aren't acknowledged, so nothing is lost by refusing them while draining
+            if self.bot_manager.draining:
+                return web.Response(status=503)
+            try:
+                data = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            self.receive(data)
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(f"/{url_path}", receive_update)
+        self.server = web.AppRunner(app, handle_signals=False)
+        await self.server.setup()
+        await web.TCPSite(self.server, "0.0.0.0", port).start()
+        await self.transport.call("setWebhook", {"url": webhook_url})
+
+    # ----------- SHUTDOWN ----------
+
+    async def wait_for_idle(self, deadline):
+        """Waits until no updates or sends have been waiting for two checks in a row, or the deadline passes"""
+        idle_checks = 0
+        while time.monotonic() < deadline:
+            idle_checks = idle_checks + 1 if self.inbox.empty() and self.outbox.empty() else 0
+            if idle_checks == 2:
+                return True
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+        return False
+
+    async def drain(self):
+        """Stops the bot, saving every game in progress, like Drainer.drain does for the threaded bot"""
+        start = time.monotonic()
+        logger.info("Draining before shutdown...")
+
+        # Stop taking in updates; unconfirmed ones are delivered again to the next process
+        self.bot_manager.draining = True
+        if self.poller is not None:
+            self.poller.cancel()
+        flushed = await self.wait_for_idle(start + DRAIN_TIMEOUT)
+
+        # Timers can't fire while this runs, since they run on this same loop
+        state = self.bot_manager.to_dict(self.job_queue)
+        self.drainer.save(state)
+
+        elapsed = time.monotonic() - start
+        logger.info("Drained %d games in %.2fs (outbound messages %s)", len(state["games"]), elapsed,
+                    "flushed" if flushed else "not flushed before the deadline")
+        self.drainer.log_drain(len(state["games"]), elapsed, flushed)
+        self.stopped.set()
+
+    async def serve(self, webhook=None):
+        """Runs until SIGINT, or SIGTERM which drains first; webhook is (port, url_path, webhook_url) or None to poll"""
+        await self.start()
+
+        # Resume any games saved when the previous process shut down, before new updates start arriving
+        self.drainer.restore()
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.drain()))
+        loop.add_signal_handler(signal.SIGINT, self.stopped.set)
+
+        if webhook is None:
+            self.poller = asyncio.create_task(self.poll())
+        else:
+            await self.start_webhook(*webhook)
+
+        await self.stopped.wait()
+        if self.poller is not None:
+            self.poller.cancel()
+        if self.server is not None:
+            await self.server.cleanup()
+        self.job_queue.stop()
+        await self.transport.close()
+
+    def run(self, webhook=None):
+        asyncio.run(self.serve(webhook))
+
+
+# -------- HELPER FUNCTIONS ---------
+
+def to_api(value):
+    """Converts an argument for a Bot method into its JSON form"""
+    if isinstance(value, TelegramObject):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_api(item) for item in value]
+    return value
+
+
+def parse_result(status, payload):
+    """Returns the result of an API response, raising the error PTB would raise for a failed one"""
+    try:
+        data = json.loads(payload.decode("utf-8"))
+    except ValueError:
+        # e.g. an HTML error page from a proxy in front of the API
+        raise NetworkError(f"Invalid server response (HTTP {status})")
+    if not isinstance(data, dict):
+        raise NetworkError(f"Invalid server response (HTTP {status})")
+    if data.get("ok"):
+        return data["result"]
+
+    parameters = data.get("parameters") or {}
+    description = data.get("description", "Unknown error")
+    if "retry_after" in parameters:
+        raise RetryAfter(parameters["retry_after"])
+    if "migrate_to_chat_id" in parameters:
+        raise ChatMigrated(parameters["migrate_to_chat_id"])
+    if status in (401, 403):
+        raise Unauthorized(description)
+    if status == 400:
+        raise BadRequest(description)
+    if status >= 500:
+        raise NetworkError(description)
+    raise TelegramError(description)
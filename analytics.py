@@ -0,0 +1,181 @@
+"""
+Live game statistics, maintained incrementally as guesses are made.
+Every aggregate lives in a fixed-size structure, so recording and querying are both O(1)
+regardless of how many games have been played.
+"""
+
+from array import array
+from threading import Lock
+
+SKETCH_DEPTH = 4
+SKETCH_WIDTH = 2048
+TOP_OPENERS = 10
+MAX_CAPACITY = 16
+
+
+# ----------- FREQUENCY SKETCH ----------
+
+class CountMinSketch:
+    """Approximate frequency counter using a fixed grid of counters, never under-counting"""
+    def __init__(self, depth=SKETCH_DEPTH, width=SKETCH_WIDTH):
+        self.depth = depth
+        self.width = width
+        self.rows = [array("L", [0]) * width for _ in range(depth)]
+
+    def _cells(self, key: str):
+        return [(row, hash((row, key)) % self.width) for row in range(self.depth)]
+
+    def add(self, key: str):
+        """Counts one occurrence of the key and returns its new estimate"""
+        estimate = None
+        for row, cell in self._cells(key):
+            self.rows[row][cell] += 1
+            count = self.rows[row][cell]
+            estimate = count if estimate is None else min(estimate, count)
+        return estimate
+
+    def estimate(self, key: str):
+        return min(self.rows[row][cell] for row, cell in self._cells(key))
+
+
+class TopK:
+    """Keeps the k keys with the highest sketch estimates seen so far"""
+    def __init__(self, k=TOP_OPENERS):
+        self.k = k
+        self.sketch = CountMinSketch()
+        self.leaders = {}
+
+    def add(self, key: str):
+        estimate = self.sketch.add(key)
+
+        if key in self.leaders or len(self.leaders) < self.k:
+            self.leaders[key] = estimate
+            return
+
+        # Replace the weakest leader if the new key has overtaken it
+        weakest = min(self.leaders, key=self.leaders.get)
+        if estimate > self.leaders[weakest]:
+            del self.leaders[weakest]
+            self.leaders[key] = estimate
+
+    def top(self):
+        return sorted(self.leaders.items(), key=lambda item: item[1], reverse=True)
+
+
+# ----------- GAME STATS ----------
+
+class AnswerStats:
+    """Per-answer counters for a single word bank, indexed by each answer's position in the bank"""
+    def __init__(self, size):
+        self.appearances = array("L", [0]) * size
+        self.solves = array("L", [0]) * size
+        self.solve_guesses = array("L", [0]) * size
+
+
+class GameStats:
+    """Aggregates per-answer difficulty, opening guesses and elimination times"""
+    def __init__(self, max_capacity=MAX_CAPACITY):
+        # Keyed by bank name rather than bank object, so counts survive a bank being evicted and reloaded
+        self.answer_stats = {}
+
+        self.eliminations = array("L", [0]) * (max_capacity + 1)
+        self.elimination_secs = array("d", [0.0]) * (max_capacity + 1)
+
+        self.openers = TopK()
+        self.guess_count = self.opener_count = 0
+        self.total_appearances = self.total_solves = self.total_solve_guesses = 0
+        self.lock = Lock()
+
+    def for_bank(self, bank):
+        """Returns the bank's answer counters, creating them the first time the bank is seen"""
+        answer_stats = self.answer_stats.get(bank.name)
+        if answer_stats is None:
+            with self.lock:
+                answer_stats = self.answer_stats.setdefault(bank.name, AnswerStats(len(bank.answers)))
+        return answer_stats
+
+    def record_appearance(self, bank, answer: str):
+        """Called whenever a word with this answer is added to a player's stack"""
+        i = bank.answer_index.get(answer)
+        if i is None:
+            return
+        answer_stats = self.for_bank(bank)
+        with self.lock:
+            answer_stats.appearances[i] += 1
+            self.total_appearances += 1
+
+    def record_guess(self, guess: str, is_opener: bool):
+        """Called for every valid guess made"""
+        with self.lock:
+            self.guess_count += 1
+            if is_opener:
+                self.opener_count += 1
+                self.openers.add(guess)
+
+    def record_solve(self, bank, answer: str, guesses: int):
+        """Called when a word is cleared, with the number of guesses it spent in the stack"""
+        i = bank.answer_index.get(answer)
+        if i is None:
+            return
+        answer_stats = self.for_bank(bank)
+        with self.lock:
+            answer_stats.solves[i] += 1
+            answer_stats.solve_guesses[i] += guesses
+            self.total_solves += 1
+            self.total_solve_guesses += guesses
+
+    def record_elimination(self, capacity: int, seconds: float):
+        """Called when a player is overwhelmed, with the time since the game began"""
+        if not 0 <= capacity < len(self.eliminations):
+            return
+        with self.lock:
+            self.eliminations[capacity] += 1
+            self.elimination_secs[capacity] += seconds
+
+    def word_summary(self, bank, answer: str):
+        """Formats the solve rate and mean guesses to solve for a single answer word"""
+        i = bank.answer_index.get(answer)
+        if i is None:
+            return f"{answer} is not an answer word in the {bank.name} word bank."
+
+        answer_stats = self.for_bank(bank)
+
+        appearances, solves = answer_stats.appearances[i], answer_stats.solves[i]
+        msg = f"{answer}: solved {solves}/{appearances} ({percent(solves, appearances)})"
+        if solves:
+            msg += f", {answer_stats.solve_guesses[i] / solves:.1f} guesses on average"
+        return msg
+
+    def summary(self):
+        """Formats the overall statistics"""
+        msg = "📊 STATS 📊\n"
+        msg += f"Guesses made: {self.guess_count} ({self.opener_count} openers)\n"
+        msg += f"Words solved: {self.total_solves}/{self.total_appearances} " \
+               f"({percent(self.total_solves, self.total_appearances)})"
+        if self.total_solves:
+            msg += f", {self.total_solve_guesses / self.total_solves:.1f} guesses on average"
+
+        openers = self.openers.top()
+        if openers:
+            msg += "\n\nTop openers: " + ", ".join([f"{word} (~{count})" for word, count in openers])
+
+        eliminations = [f"{capacity} words: {count} eliminated after {format_secs(self.elimination_secs[capacity] / count)}"
+                        for capacity, count in enumerate(self.eliminations) if count]
+        if eliminations:
+            msg += "\n\nTime to elimination:\n" + "\n".join(eliminations)
+
+        return msg
+
+
+# -------- HELPER FUNCTIONS ---------
+
+def percent(part, whole):
+    return f"{100 * part / whole:.0f}%" if whole else "n/a"
+
+
+def format_secs(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s"
+
+
+stats = GameStats()
@@ -0,0 +1,143 @@
+"""
+Word banks that groups can choose between.
+Each bank is loaded on first use, shared read-only by every game that uses it,
+and kept in a small LRU cache so unused banks can be evicted.
+"""
+
+import os
+import re
+import sys
+from collections import OrderedDict
+from random import choice
+from threading import Lock
+import wordbank
+
+DEFAULT_BANK = "english"
+BANK_CACHE_SIZE = 4
+BANK_DIR = os.environ.get("BANK_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "banks"))
+DRAW_ATTEMPTS = 50
+WORD_PATTERN = re.compile("^[A-Z]{5}$")
+
+
+# ----------- WORD BANK ----------
+
+class WordBank:
+    """An immutable pair of valid guesses and answer words, with O(1) validation and random draw"""
+    def __init__(self, name, valid_words, answer_words):
+        self.name = name
+
+        # Interning lets every bank (and the answers within a bank) share a single copy of each word
+        self.answers = tuple(sys.intern(word) for word in clean(answer_words))
+        self.valid = frozenset(sys.intern(word) for word in clean(valid_words)) | frozenset(self.answers)
+        self.answer_index = {word: i for i, word in enumerate(self.answers)}
+
+        if not self.answers:
+            raise ValueError(f"Word bank {name} has no answer words")
+
+    def is_valid(self, word: str):
+        return word in self.valid
+
+    def draw(self, exclude=()):
+        """Returns a random answer word, avoiding those in exclude where possible"""
+        for _ in range(DRAW_ATTEMPTS):
+            word = choice(self.answers)
+            if word not in exclude:
+                return word
+        return choice(self.answers)
+
+
+# ----------- LOADERS ----------
+
+def load_english():
+    return WordBank("english", wordbank.valid_words, wordbank.answer_words)
+
+
+def load_easy():
+    """English, but only common words are accepted as guesses"""
+    return WordBank("easy", wordbank.answer_words, wordbank.answer_words)
+
+
+def load_from_dir(name):
+    """Loads BANK_DIR/<name>/valid.txt and answers.txt, one word per line; answers.txt is optional"""
+    bank_path = os.path.join(BANK_DIR, name)
+    with open(os.path.join(bank_path, "valid.txt"), encoding="utf-8") as file:
+        valid_words = file.read().split()
+
+    answers_path = os.path.join(bank_path, "answers.txt")
+    if os.path.exists(answers_path):
+        with open(answers_path, encoding="utf-8") as file:
+            answer_words = file.read().split()
+    else:
+        answer_words = valid_words
+
+    return WordBank(name, valid_words, answer_words)
+
+
+BUILTIN_BANKS = {
+    "english": load_english,
+    "easy": load_easy,
+}
+
+
+# ----------- BANK REGISTRY ----------
+
+class BankRegistry:
+    """Loads banks on demand and counts the games using each, evicting the least recently used idle banks"""
+    def __init__(self, capacity=BANK_CACHE_SIZE):
+        self.capacity = capacity
+        self.loaded = OrderedDict()
+        self.users = {}
+        self.lock = Lock()
+
+    def available(self):
+        """Names of every bank that can be loaded"""
+        names = set(BUILTIN_BANKS)
+        if os.path.isdir(BANK_DIR):
+            names.update(entry for entry in os.listdir(BANK_DIR)
+                         if os.path.isfile(os.path.join(BANK_DIR, entry, "valid.txt")))
+        return sorted(names)
+
+    def exists(self, name):
+        return name in self.available()
+
+    def acquire(self, name=DEFAULT_BANK):
+        """Returns the named bank, loading it if needed, and registers one more game as using it"""
+        with self.lock:
+            bank = self.loaded.get(name)
+            if bank is None:
+                loader = BUILTIN_BANKS.get(name)
+                bank = loader() if loader else load_from_dir(name)
+                self.loaded[name] = bank
+                self.users[name] = 0
+                print(f"Loaded word bank {name}")
+
+            self.loaded.move_to_end(name)
+            self.users[name] += 1
+            self._evict()
+            return bank
+
+    def release(self, bank):
+        """Registers that a game has stopped using the bank"""
+        with self.lock:
+            if self.users.get(bank.name, 0) > 0:
+                self.users[bank.name] -= 1
+            self._evict()
+
+    def _evict(self):
+        for name in list(self.loaded):
+            if len(self.loaded) <= self.capacity:
+                return
+            if self.users[name] == 0:
+                del self.loaded[name]
+                del self.users[name]
+                print(f"Evicted word bank {name}")
+
+
+# -------- HELPER FUNCTIONS ---------
+
+def clean(words):
+    """Uppercases the words, dropping any that can't be typed as a 5-letter guess"""
+    return list(OrderedDict.fromkeys(word.upper() for word in words if WORD_PATTERN.match(word.upper())))
+
+
+registry = BankRegistry()
@@ -0,0 +1,307 @@
+"""
+Benchmarks the threaded and asyncio modes of the bot against each other on the same synthetic load, with the
+Bot API faked in-process and answering after a fixed delay. Each game's players open a lobby, join it through
+the start link and begin, then guess every few seconds (sometimes solving a word) until the time is up.
+Reports how long setup took (until every setup message had been sent), the throughput of guesses and sends, the
+latency from a guess arriving to the reply to that guess being delivered, and memory and threads per game. Each mode runs in its own process:
+
+    python benchmark.py [--mode both|threaded|async] [--games 100] [--players 3] [--latency 50] [--seconds 20]
+"""
+
+import os
+
+# Lift the admission limits, so the benchmark measures the bot rather than the admission controller
+for limit in ("MAX_QUEUED_UPDATES", "MAX_OUTBOUND", "MAX_OUTBOX", "MAX_ACTIVE_PLAYERS"):
+    os.environ.setdefault(limit, "1000000")
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import redirect_stdout
+from telegram import Bot
+from telegram.ext import Updater
+from admission import admission, MAX_OUTBOX
+from aio import AsyncRunner, FakeAsyncTransport
+from banks import registry, DEFAULT_BANK
+from multiplayer import BotManager, START_LINK, JOIN_CALLBACK
+from transport import FakeRequest, FAKE_TOKEN, WORKERS
+import bot
+
+SETUP_TIMEOUT = 300
+WAIT_INTERVAL = 0.01
+IDLE_CHECKS = 2
+REPLY_GRACE = 2
+ELIMINATED = "You've been eliminated!"
+
+
+# ----------- LOAD ----------
+
+class Load:
+    """Generates the updates for every game and measures the time from each guess to the reply to that guess"""
+    def __init__(self, args, bot_manager, push_update, add_member):
+        self.args = args
+        self.bot_manager = bot_manager
+        self.push_update = push_update
+        self.add_member = add_member
+        self.update_ids = itertools.count(1)
+        self.words = registry.acquire(DEFAULT_BANK).answers
+        self.groups = [-(1000 + game) for game in range(args.games)]
+        self.players = {group: [10000 + game * args.players + i for i in range(args.players)]
+                        for game, group in enumerate(self.groups)}
+
+        self.lock = threading.Lock()
+        self.waiting = {user_id: deque() for players in self.players.values() for user_id in players}
+        self.latencies_ms = []
+        self.guesses = self.sent = 0
+        self.playing = False
+
+    # ----------- UPDATES ----------
+
+    def message(self, chat, user_id, text):
+        data = {"message_id": next(self.update_ids), "date": int(time.time()), "chat": chat, "text": text,
+                "from": {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}"}}
+        if text.startswith("/"):
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.push_update({"update_id": next(self.update_ids), "message": data})
+
+    def group_message(self, group, user_id, text):
+        self.message({"id": group, "type": "group", "title": f"Group{-group}"}, user_id, text)
+
+    def private_message(self, user_id, text):
+        self.message({"id": user_id, "type": "private", "first_name": f"Player{user_id}"}, user_id, text)
+
+    def join_click(self, group, user_id):
+        user = {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}"}
+        message = {"message_id": next(self.update_ids), "date": int(time.time()), "text": "Join",
+                   "chat": {"id": user_id, "type": "private", "first_name": f"Player{user_id}"}}
+        self.push_update({"update_id": next(self.update_ids),
+                          "callback_query": {"id": str(next(self.update_ids)), "from": user, "message": message,
+                                             "chat_instance": str(group), "data": f"{JOIN_CALLBACK}{group}"}})
+
+    # ----------- PHASES ----------
+
+    def setup_steps(self):
+        """Yields each batch of setup updates to send, paired with a check for when the games reflect them"""
+        games = self.bot_manager.game_managers
+
+        def open_lobbies():
+            for group in self.groups:
+                self.group_message(group, self.players[group][0], "/startgame")
+
+        def join_lobbies():
+            for group, players in self.players.items():
+                for user_id in players:
+                    self.add_member(group, user_id)
+                    self.private_message(user_id, f"/start {START_LINK}{group}")
+                    self.join_click(group, user_id)
+
+        def begin_games():
+            for group in self.groups:
+                self.group_message(group, self.players[group][0], "/begin")
+
+        yield open_lobbies, lambda: sum(game.game_is_on for game in games) == len(self.groups)
+        yield join_lobbies, lambda: len(self.bot_manager.player_games) == len(self.groups) * self.args.players
+        yield begin_games, lambda: sum(game.game_has_begun for game in games) == len(self.groups)
+
+    def schedule(self):
+        """Times (from the start of play) at which each player guesses, each player starting at a random offset"""
+        times = [(random.uniform(0, self.args.interval) + self.args.interval * n, user_id)
+                 for players in self.players.values() for user_id in players
+                 for n in range(int(self.args.seconds / self.args.interval))]
+        return sorted(times)
+
+    def guess(self, user_id):
+        """Sends a guess from the player, solving their oldest word some of the time, if they are still playing"""
+        game = self.bot_manager.player_games.get(user_id)
+        if game is None or game.game_has_ended or user_id not in game.current_players:
+            return
+
+        # A word repeated from the last ten guesses would be rejected rather than played
+        word_manager = next(wm for player, wm in list(game.word_managers.items()) if player.id == user_id)
+        word = random.choice(self.words)
+        while word.upper() in word_manager.recent_guesses:
+            word = random.choice(self.words)
+        if random.random() < self.args.solve_rate:
+            answers = [current.answer for current in word_manager.current_words if not current.is_blank]
+            word = answers[0] if answers else word
+
+        with self.lock:
+            self.guesses += 1
+            self.waiting[user_id].append((word.upper(), time.perf_counter()))
+        self.private_message(user_id, word.lower())
+
+    def on_api(self, method, data, result):
+        """Transport listener timing each guess to its reply, which lists the guess first among the last ten"""
+        if method != "sendMessage" or not self.playing:
+            return
+        now = time.perf_counter()
+        text = data.get("text") or ""
+        with self.lock:
+            self.sent += 1
+            pending = self.waiting.get(int(data["chat_id"]))
+            if not pending:
+                return
+            word, start = pending[0]
+            # Status updates sent on other players' moves list the guesses too, but never one still unanswered
+            if f"Last 10 guesses: {word}" in text or text.endswith(ELIMINATED):
+                pending.popleft()
+                self.latencies_ms.append((now - start) * 1000)
+
+    def report(self, mode, setup_secs, play_secs, rss_before):
+        latencies = sorted(self.latencies_ms) or [0]
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+        return {"mode": mode, "games": len(self.groups), "players": len(self.groups) * self.args.players,
+                "setup_secs": round(setup_secs, 2),
+                "guesses_per_sec": round(self.guesses / play_secs, 1),
+                "sends_per_sec": round(self.sent / play_secs, 1),
+                "replies": len(self.latencies_ms), "unanswered": sum(map(len, self.waiting.values())),
+                "latency_ms": {"p50": round(latencies[len(latencies) // 2], 1),
+                               "p95": round(latencies[int(len(latencies) * 0.95)], 1),
+                               "max": round(latencies[-1], 1)},
+                "peak_rss_kb_per_game": round(rss_kb / len(self.groups), 1),
+                "threads": threading.active_count()}
+
+
+# ----------- MODES ----------
+
+def run_threaded(args):
+    """Runs the load through the Updater, its dispatcher thread and APScheduler job queue, as bot.main does"""
+    request = FakeRequest(latency_ms=args.latency)
+    updater = Updater(bot=Bot(FAKE_TOKEN, request=request), workers=WORKERS)
+    admission.attach(updater.dispatcher, request)
+    bot_manager = BotManager()
+    bot.register_handlers(updater.dispatcher, bot_manager)
+
+    load = Load(args, bot_manager, request.push_update, request.add_member)
+    request.listeners.append(load.on_api)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    updater.start_polling(poll_interval=0, timeout=1)
+
+    def is_idle():
+        return request.updates.empty() and updater.dispatcher.update_queue.empty() and request.latency.in_flight == 0
+
+    start = time.perf_counter()
+    for send, is_done in load.setup_steps():
+        send()
+        deadline = time.monotonic() + SETUP_TIMEOUT
+        idle_checks = 0
+        while idle_checks < IDLE_CHECKS and time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            idle_checks = idle_checks + 1 if is_done() and is_idle() else 0
+    setup_secs = time.perf_counter() - start
+
+    load.playing = True
+    start = time.perf_counter()
+    for due, user_id in load.schedule():
+        time.sleep(max(0.0, start + due - time.perf_counter()))
+        load.guess(user_id)
+    play_secs = time.perf_counter() - start
+    time.sleep(REPLY_GRACE)
+
+    report = load.report("threaded", setup_secs, play_secs, rss_before)
+    updater.stop()
+    return report
+
+
+async def run_async(args):
+    """Runs the load through AsyncRunner on a single event loop, as bot.main_async does"""
+    transport = FakeAsyncTransport(latency_ms=args.latency)
+    bot_manager = BotManager()
+    runner = AsyncRunner(transport, bot_manager)
+    admission.attach(runner.dispatcher, runner.outbox, max_outbound=MAX_OUTBOX)
+    bot.register_handlers(runner.dispatcher, bot_manager)
+
+    load = Load(args, bot_manager, transport.push_update, transport.add_member)
+    transport.listeners.append(load.on_api)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    await runner.start()
+    runner.poller = asyncio.create_task(runner.poll())
+
+    def is_idle():
+        return transport.updates.empty() and runner.inbox.empty() and runner.outbox.empty()
+
+    start = time.perf_counter()
+    for send, is_done in load.setup_steps():
+        send()
+        deadline = time.monotonic() + SETUP_TIMEOUT
+        idle_checks = 0
+        while idle_checks < IDLE_CHECKS and time.monotonic() < deadline:
+            await asyncio.sleep(WAIT_INTERVAL)
+            idle_checks = idle_checks + 1 if is_done() and is_idle() else 0
+    setup_secs = time.perf_counter() - start
+
+    load.playing = True
+    start = time.perf_counter()
+    for due, user_id in load.schedule():
+        await asyncio.sleep(max(0.0, start + due - time.perf_counter()))
+        load.guess(user_id)
+    play_secs = time.perf_counter() - start
+    await asyncio.sleep(REPLY_GRACE)
+
+    report = load.report("async", setup_secs, play_secs, rss_before)
+    runner.poller.cancel()
+    runner.job_queue.stop()
+    return report
+
+
+def run_mode(args):
+    # The game code prints every answer word drawn and PTB logs every job, which would drown out the report
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return run_threaded(args) if args.mode == "threaded" else asyncio.run(run_async(args))
+
+
+def run_both(args):
+    """Runs each mode in a fresh process, so neither shares singletons or memory with the other"""
+    reports = []
+    for mode in ("threaded", "async"):
+        command = [sys.executable, __file__, "--mode", mode, "--json"] + \
+                  [f"--{name.replace('_', '-')}={value}" for name, value in vars(args).items()
+                   if name not in ("mode", "json")]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        reports.append(json.loads(output.strip().splitlines()[-1]))
+    return reports
+
+
+def format_report(report):
+    latency = report["latency_ms"]
+    return f"{report['mode']}: {report['games']} games, {report['players']} players\n" \
+           f"  setup {report['setup_secs']:.2f}s\n" \
+           f"  {report['guesses_per_sec']:.1f} guesses/s, {report['sends_per_sec']:.1f} sends/s\n" \
+           f"  guess to reply: p50 {latency['p50']:.0f}ms, p95 {latency['p95']:.0f}ms, max {latency['max']:.0f}ms " \
+           f"({report['replies']} replies, {report['unanswered']} unanswered)\n" \
+           f"  {report['peak_rss_kb_per_game']:.1f}KB peak RSS per game, {report['threads']} threads"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the threaded and asyncio modes of the bot.")
+    parser.add_argument("--mode", choices=("both", "threaded", "async"), default="both")
+    parser.add_argument("--games", type=int, default=100, help="number of concurrent games")
+    parser.add_argument("--players", type=int, default=3, help="players in each game")
+    parser.add_argument("--latency", type=float, default=50, help="simulated Bot API latency in milliseconds")
+    parser.add_argument("--seconds", type=float, default=20, help="how long players keep guessing")
+    parser.add_argument("--interval", type=float, default=3, help="seconds between each player's guesses")
+    parser.add_argument("--solve-rate", type=float, default=0.3, help="fraction of guesses that solve a word")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = parser.parse_args()
+
+    reports = run_both(args) if args.mode == "both" else [run_mode(args)]
+    if args.json:
+        print(json.dumps(reports[0] if len(reports) == 1 else reports))
+    else:
+        print("\n\n".join(format_report(report) for report in reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,17 +6,29 @@ Deployed using Heroku.
 
 import logging
 import os
+import signal
 from multiplayer import BotManager, join, about, how_to_play, example, START_LINK, JOIN_CALLBACK
+from admin import show_stats, show_api_stats, profile, show_load
+from admission import admission, MAX_OUTBOX
+from transport import make_request, WORKERS
+from drain import Drainer
+from recorder import Recorder
+from aio import AsyncRunner, make_transport
+from telegram import Bot, Update
 from telegram.ext import (
     Updater,
     CommandHandler,
     MessageHandler,
     Filters,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    TypeHandler
 )
 
 PORT = int(os.environ.get('PORT', "8443"))
 TOKEN = os.environ.get("TOKEN")
+RECORD_TRACE = os.environ.get("RECORD_TRACE")
+ASYNC_MODE = os.environ.get("ASYNC_MODE") == "1"
+WEBHOOK_URL = 'https://radiant-sea-67615.herokuapp.com/'
 
 # Enable logging
 logging.basicConfig(
@@ -31,17 +43,8 @@ def error(update, context):
     logger.warning('Update "%s" caused error "%s"', update, context.error)
 
 
-def main() -> None:
-    """Run the bot."""
-    # Create the Updater and pass it your bot's token.
-    updater = Updater(TOKEN)
-
-    # Get the dispatcher to register handlers
-    dispatcher = updater.dispatcher
-
-    # Initialise bot manager to manage simultaneous games and game data
-    bot_manager = BotManager()
-
+def register_handlers(dispatcher, bot_manager) -> None:
+    """Registers every command and message handler, shared by the live bot and the trace replayer"""
     # Initiate the game
     dispatcher.add_handler(CommandHandler("about", about))
     dispatcher.add_handler(CommandHandler("help", how_to_play))
@@ -53,20 +56,79 @@ def main() -> None:
     dispatcher.add_handler(CommandHandler("begin", bot_manager.begin_game))
     dispatcher.add_handler(MessageHandler(Filters.regex("^[a-zA-Z]{5}$"), bot_manager.guess_callback))
     dispatcher.add_handler(CommandHandler("end", bot_manager.force_end))
+    dispatcher.add_handler(CommandHandler("wordbank", bot_manager.choose_bank))
+
+    # Admin commands
+    dispatcher.add_handler(CommandHandler("stats", show_stats))
+    dispatcher.add_handler(CommandHandler("apistats", show_api_stats))
+    dispatcher.add_handler(CommandHandler("profile", profile))
+    dispatcher.add_handler(CommandHandler("load", show_load(bot_manager)))
 
     # Add error handler
     dispatcher.add_error_handler(error)
 
+
+def main() -> None:
+    """Run the bot."""
+    if ASYNC_MODE:
+        main_async()
+        return
+
+    # Create the Updater with a bot whose API calls go through the pooled transport
+    request = make_request()
+    bot = Bot(TOKEN, request=request)
+    updater = Updater(bot=bot, workers=WORKERS)
+
+    # Get the dispatcher to register handlers
+    dispatcher = updater.dispatcher
+
+    # Let admission control see the dispatcher's backlog and the transport's in-flight calls
+    admission.attach(dispatcher, request)
+
+    # Initialise bot manager to manage simultaneous games and game data
+    bot_manager = BotManager()
+    register_handlers(dispatcher, bot_manager)
+
+    # Record incoming updates, anonymised, for replaying later
+    if RECORD_TRACE:
+        recorder = Recorder(RECORD_TRACE)
+        dispatcher.add_handler(TypeHandler(Update, recorder.record), group=-1)
+        request.listeners.append(recorder.observe_api)
+
+    # Resume any games saved when the previous process shut down, before new updates start arriving
+    drainer = Drainer(updater, bot_manager)
+    drainer.restore()
+
     # Start the Bot
     updater.start_webhook(listen="0.0.0.0",
                           port=int(PORT),
                           url_path=TOKEN,
-                          webhook_url='https://radiant-sea-67615.herokuapp.com/' + TOKEN)
+                          webhook_url=WEBHOOK_URL + TOKEN)
+
+    # Run the bot until you press Ctrl-C or the process receives SIGINT or SIGABRT.
+    # SIGTERM (sent by Heroku on deploys and restarts) drains and saves running games before stopping.
+    signal.signal(signal.SIGTERM, drainer.drain)
+    updater.idle(stop_signals=(signal.SIGINT, signal.SIGABRT))
+
+
+def main_async() -> None:
+    """Run the bot on an event loop, with no dispatcher, worker or job queue threads."""
+    transport = make_transport(TOKEN)
+    bot_manager = BotManager()
+    runner = AsyncRunner(transport, bot_manager)
+
+    # Let admission control see the runner's backlog of updates and the outbox's backlog of sends
+    admission.attach(runner.dispatcher, runner.outbox, max_outbound=MAX_OUTBOX)
+    register_handlers(runner.dispatcher, bot_manager)
+
+    # Record incoming updates, anonymised, for replaying later
+    if RECORD_TRACE:
+        recorder = Recorder(RECORD_TRACE)
+        runner.dispatcher.add_handler(TypeHandler(Update, recorder.record), group=-1)
+        transport.listeners.append(recorder.observe_api)
 
-    # Run the bot until you press Ctrl-C or the process receives SIGINT,
-    # SIGTERM or SIGABRT. This should be used most of the time, since
-    # start_polling() is non-blocking and will stop the bot gracefully.
-    updater.idle()
+    # Serve the webhook. SIGTERM drains and saves running games before stopping, as in the threaded mode.
+    runner.run(webhook=(PORT, TOKEN, WEBHOOK_URL + TOKEN))
 
 
 if __name__ == '__main__':
@@ -1,7 +1,7 @@
 from telegram import Update
 from telegram.ext import CallbackContext
-from wordbank import answer_words, valid_words
-from random import choice
+from analytics import stats
+from time import monotonic
 
 WORD_DROP = 3
 START_WORDS = 2
@@ -10,11 +10,11 @@ STATE_EMOJIS = ["⬇️", "5️⃣", "4️⃣", "3️⃣", "2️⃣", "1️⃣"]
 
 # ----------- INVALID INPUTS ----------
 
-def check_valid(user_input, previous_guesses):
+def check_valid(user_input, previous_guesses, bank):
     """Catches all invalid inputs"""
     # Check if the input is in the valid word list of 5-letter words
 
-    if user_input not in valid_words:
+    if not bank.is_valid(user_input):
         return "Sorry, that's not in the word list. Try again."
 
     # Check if the guessed word is in the last 10 words
@@ -39,8 +39,9 @@ def format_results(results: list):
 
 class Word:
     """Word class which includes checking methods etc"""
-    def __init__(self, blank=False, inherit=""):
+    def __init__(self, blank=False, inherit="", bank=None, exclude=()):
         self.is_guessed = self.is_inherited = self.to_be_sent = False
+        self.guesses = 0
 
         # Create attribute for blankness, passed when calling the Object
         self.is_blank = blank
@@ -53,11 +54,14 @@ class Word:
             self.is_inherited = True
             print(f"Inherited {inherit}")
 
-        # If not blank, choose an answer word
+        # If not blank, choose an answer word from the bank
         else:
-            self.answer = choice(answer_words)
+            self.answer = bank.draw(exclude)
             print(self.answer)
 
+        if not self.is_blank:
+            stats.record_appearance(bank, self.answer)
+
         # Initialise the format of the hints
         self.green_hints = ["•"] * 5
         self.yellow_hints = [""] * 5
@@ -126,20 +130,41 @@ class Word:
 
         return squares_formatted + hints_formatted
 
+    def to_dict(self):
+        """Serialises the word so that it can be restored after a restart"""
+        return {"answer": self.answer, "is_blank": self.is_blank, "is_inherited": self.is_inherited,
+                "is_guessed": self.is_guessed, "guesses": self.guesses, "green_hints": self.green_hints,
+                "yellow_hints": self.yellow_hints, "ordered_hints": self.ordered_hints}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restores a word serialised by to_dict, without drawing a new answer"""
+        word = cls(blank=True)
+        word.__dict__.update(data)
+        return word
+
 
 # ----------- WORD MANAGER CLASS ----------
 
 class WordManager:
     """Manages all the current words and guesses, linked to a specific player"""
-    def __init__(self, capacity):
+    def __init__(self, capacity, bank, used_answers):
         # The words list is initialised as a list of blank words with length capacity (they become white squares)
         self.capacity = capacity
+
+        # The bank is shared read-only, so answers already drawn in this game are tracked separately
+        self.bank = bank
+        self.used_answers = used_answers
         self.current_words = [Word(blank=True)] * self.capacity
         self.current_results = self.recent_guesses = []
         self.guess_count = self.word_count = 0
         self.answer_to_inherit = ""
         self.correct_word_place = None
         self.lost_game = self.won_game = False
+        self.start_time = monotonic()
+
+        # Called with "win" or "lose" the moment the player wins or loses, so the game can react once
+        self.on_result = None
 
         for i in range(START_WORDS):
             self.add_word()
@@ -147,20 +172,51 @@ class WordManager:
         # Initialise results to accommodate opponents sending words before user has made any guesses
         self.current_results = [word.guess_to_squares("00000") for word in self.current_words]
 
+    def to_dict(self):
+        """Serialises the player's stack and guesses so that they can be restored after a restart"""
+        return {"capacity": self.capacity, "current_words": [word.to_dict() for word in self.current_words],
+                "current_results": self.current_results, "recent_guesses": self.recent_guesses,
+                "guess_count": self.guess_count, "word_count": self.word_count,
+                "answer_to_inherit": self.answer_to_inherit, "lost_game": self.lost_game, "won_game": self.won_game,
+                "elapsed": monotonic() - self.start_time}
+
+    @classmethod
+    def from_dict(cls, data, bank, used_answers):
+        """Restores a word manager serialised by to_dict"""
+        word_manager = cls.__new__(cls)
+        word_manager.bank = bank
+        word_manager.used_answers = used_answers
+        word_manager.capacity = data["capacity"]
+        word_manager.current_words = [Word.from_dict(word) for word in data["current_words"]]
+        word_manager.current_results = data["current_results"]
+        word_manager.recent_guesses = data["recent_guesses"]
+        word_manager.guess_count = data["guess_count"]
+        word_manager.word_count = data["word_count"]
+        word_manager.answer_to_inherit = data["answer_to_inherit"]
+        word_manager.correct_word_place = None
+        word_manager.lost_game = data["lost_game"]
+        word_manager.won_game = data["won_game"]
+        word_manager.start_time = monotonic() - data["elapsed"]
+        word_manager.on_result = None
+        return word_manager
+
     def add_word(self, inherit=""):
         """Changes the first blank word into a non-blank word"""
         if self.word_count == self.capacity:
-            self.lost_game = True
+            if not self.lost_game:
+                self.lost_game = True
+                stats.record_elimination(self.capacity, monotonic() - self.start_time)
+                self.report_result("lose")
             return
 
         for i in range(self.capacity):
             if self.current_words[i].is_blank:
                 if inherit == "":
-                    self.current_words[i] = Word()
-                    answer_words.remove(self.current_words[i].answer)
+                    self.current_words[i] = Word(bank=self.bank, exclude=self.used_answers)
+                    self.used_answers.add(self.current_words[i].answer)
 
                 else:
-                    self.current_words[i] = Word(inherit=inherit)
+                    self.current_words[i] = Word(inherit=inherit, bank=self.bank)
 
                 self.word_count += 1
                 break
@@ -184,6 +240,11 @@ class WordManager:
         self.current_words.append(Word(blank=True))
         self.word_count -= 1
 
+    def report_result(self, result):
+        """Tells the game that this player has won or lost"""
+        if self.on_result is not None:
+            self.on_result(result)
+
     def receive_blocks(self, sender_name, receiver_chat_id, context, inherit=""):
         """If an opponent gets a word right, this function is triggered for all other users to receive a new word"""
         # Check for word inheritance and call the add word function accordingly
@@ -223,13 +284,18 @@ class WordManager:
         user_guess = update.message.text.upper()
 
         # Check the validity of the input; return an error message if invalid
-        error_message = check_valid(user_guess, self.recent_guesses)
+        error_message = check_valid(user_guess, self.recent_guesses, self.bank)
         if error_message != "valid":
             update.message.reply_text(error_message)
             return "invalid"
 
+        # Record the guess, counting it as an opener if it is the player's first valid guess
+        stats.record_guess(user_guess, is_opener=not self.recent_guesses)
+
         # Turn guess into a result
         self.current_results = [word.guess_to_squares(user_guess) for word in self.current_words]
+        for word in self.current_words:
+            word.guesses += 1
 
         # Keep track of words used in recent guesses (max 10)
         self.recent_guesses.append(user_guess)
@@ -265,6 +331,9 @@ class WordManager:
         if self.is_correct() != "incorrect":
             to_send = self.is_correct()
 
+            solved_word = self.current_words[self.correct_word_place]
+            stats.record_solve(self.bank, solved_word.answer, solved_word.guesses)
+
             self.clear_word(self.correct_word_place)
             self.correct_word_place = None
 
@@ -272,6 +341,7 @@ class WordManager:
             if self.word_count == 0:
                 update.message.reply_text("Good job, you've cleared them all! You win!")
                 self.won_game = True
+                self.report_result("win")
                 return "win"
 
             # Return correct_1 or correct_2 depending on whether it is inherited
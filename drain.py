@@ -0,0 +1,192 @@
+"""
+Graceful shutdown and resumption of games across restarts.
+On SIGTERM (sent by Heroku on every deploy and daily restart) the bot stops taking new games and updates,
+lets outbound messages finish, freezes every timer and saves the games in progress to the state store.
+The next process resumes them from there, with each timer picking up where it was paused.
+The store is STATE_FILE by default, which only works where the disk outlives the process. Heroku dynos start
+with a fresh disk, so there STATE_URL should point at a Redis or Postgres database instead (e.g. REDIS_URL).
+"""
+
+import json
+import logging
+import os
+import time
+from telegram.ext import CallbackContext
+
+STATE_FILE = os.environ.get("STATE_FILE", "state/games.json")
+STATE_URL = os.environ.get("STATE_URL", "")
+STATE_KEY = "wordle-battle-bot:games"
+DRAIN_LOG = os.environ.get("DRAIN_LOG", "state/drains.jsonl")
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", "20"))
+IDLE_CHECK_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+# ----------- STATE STORES ----------
+
+class FileStore:
+    """Keeps the saved games in a JSON file, replaced atomically so a half-written file is never resumed from"""
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as file:
+            return json.load(file)
+
+    def save(self, state):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_file = self.path + ".tmp"
+        with open(temp_file, "w") as file:
+            json.dump(state, file)
+        os.replace(temp_file, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RedisStore:
+    """Keeps the saved games under one Redis key (requires the redis package)"""
+    def __init__(self, url, key=STATE_KEY):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def load(self):
+        data = self.client.get(self.key)
+        return json.loads(data) if data is not None else None
+
+    def save(self, state):
+        self.client.set(self.key, json.dumps(state))
+
+    def delete(self):
+        self.client.delete(self.key)
+
+
+class PostgresStore:
+    """Keeps the saved games in one row of a bot_state table, created if missing (requires psycopg2)"""
+    def __init__(self, url, key=STATE_KEY):
+        import psycopg2
+        self.connect = lambda: psycopg2.connect(url)
+        self.key = key
+
+    def execute(self, query, *args):
+        # A connection per statement, since one kept open from startup may have been dropped by shutdown; each
+        # statement commits on its own, so a save is either fully written or not at all
+        connection = self.connect()
+        try:
+            with connection, connection.cursor() as cursor:
+                cursor.execute("CREATE TABLE IF NOT EXISTS bot_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+                cursor.execute(query, args)
+                return cursor.fetchone() if cursor.description else None
+        finally:
+            connection.close()
+
+    def load(self):
+        row = self.execute("SELECT value FROM bot_state WHERE key = %s", self.key)
+        return json.loads(row[0]) if row else None
+
+    def save(self, state):
+        self.execute("INSERT INTO bot_state (key, value) VALUES (%s, %s) "
+                     "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value", self.key, json.dumps(state))
+
+    def delete(self):
+        self.execute("DELETE FROM bot_state WHERE key = %s", self.key)
+
+
+def make_store(url=STATE_URL):
+    """Picks the state store from STATE_URL's scheme, falling back to STATE_FILE when it isn't set"""
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStore(url)
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresStore(url)
+    if url:
+        raise ValueError(f"STATE_URL must be a redis:// or postgres:// URL, not {url.split(':')[0]}://")
+    return FileStore()
+
+
+# ----------- DRAINER ----------
+
+class Drainer:
+    """Runs the shutdown pipeline for an updater and restores its games on the next start"""
+    def __init__(self, updater, bot_manager, store=None, drain_log=DRAIN_LOG):
+        self.updater = updater
+        self.bot_manager = bot_manager
+        self.store = store or make_store()
+        self.drain_log = drain_log
+
+    def is_idle(self):
+        """Whether there are no updates waiting to be handled and no API calls in flight"""
+        latency = getattr(self.updater.bot.request, "latency", None)
+        in_flight = latency.in_flight if latency else 0
+        return self.updater.dispatcher.update_queue.empty() and in_flight == 0
+
+    def wait_for_idle(self, deadline):
+        """Waits until the bot has been idle for two checks in a row, returning False if the deadline passes first"""
+        idle_checks = 0
+        while time.monotonic() < deadline:
+            idle_checks = idle_checks + 1 if self.is_idle() else 0
+            if idle_checks == 2:
+                return True
+            time.sleep(IDLE_CHECK_INTERVAL)
+        return False
+
+    def drain(self, signum=None, frame=None):
+        """Stops the bot, saving every game in progress; used as the SIGTERM handler"""
+        start = time.monotonic()
+        logger.info("Draining before shutdown...")
+
+        # Stop accepting new games, then stop taking in updates (Telegram re-delivers unanswered webhook updates)
+        self.bot_manager.draining = True
+        if self.updater.httpd:
+            self.updater.httpd.shutdown()
+
+        # Let queued updates be handled and outbound messages be sent
+        flushed = self.wait_for_idle(start + DRAIN_TIMEOUT)
+
+        # Wait for the handler being run (if any) to return, so no game changes while it is saved
+        self.updater.dispatcher.stop()
+
+        # Freeze every timer, so the time each had left can be saved
+        job_queue = self.updater.job_queue
+        job_queue.scheduler.pause()
+
+        state = self.bot_manager.to_dict(job_queue)
+        self.save(state)
+
+        elapsed = time.monotonic() - start
+        logger.info("Drained %d games in %.2fs (outbound messages %s)", len(state["games"]), elapsed,
+                    "flushed" if flushed else "not flushed before the deadline")
+        self.log_drain(len(state["games"]), elapsed, flushed)
+
+        self.updater.stop()
+        self.updater.is_idle = False
+
+    def save(self, state):
+        """Saves the state to the store, replacing what was there"""
+        self.store.save(state)
+
+    def log_drain(self, game_count, seconds, flushed):
+        """Appends the time to drain and the number of games drained, to track how one scales with the other"""
+        os.makedirs(os.path.dirname(self.drain_log) or ".", exist_ok=True)
+        with open(self.drain_log, "a") as file:
+            file.write(json.dumps({"time": time.time(), "games": game_count, "seconds": round(seconds, 3),
+                                   "flushed": flushed}) + "\n")
+
+    def restore(self):
+        """Resumes the games saved by the previous process, if any"""
+        state = self.store.load()
+        if state is None:
+            return
+
+        # The saved games are only deleted once they have been resumed, so a failed restore can be looked into
+        try:
+            self.bot_manager.restore(state, CallbackContext(self.updater.dispatcher))
+        except Exception:
+            logger.exception("Could not resume the saved games; leaving them in the state store")
+            return
+        self.store.delete()
+        logger.info("Resumed %d games", len(state["games"]))
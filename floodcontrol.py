@@ -0,0 +1,94 @@
+"""
+Fast path for incoming guesses.
+Each player gets a token bucket limiting how quickly their guesses are handled (with one warning per window when
+guesses are skipped), words already known to be invalid are rejected from a small cache, and a burst of invalid
+guesses gets a single merged reply.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+BUCKET_SIZE = 5
+REFILL_PER_SEC = 1.0
+REJECTED_CACHE_SIZE = 1024
+MERGE_WINDOW = 3
+THROTTLE_WINDOW = 3
+INVALID_WORD_MSG = "Sorry, that's not in the word list. Try again."
+THROTTLED_MSG = "Slow down! Guesses sent too quickly are skipped, so wait a moment and send that one again."
+
+
+class FloodControl:
+    """Per-user rate limiting and merging of invalid guess replies"""
+    def __init__(self):
+        self.buckets = {}
+        self.rejected = OrderedDict()
+        self.pending_rejections = {}
+        self.throttled = set()
+        self.lock = Lock()
+
+    def allow(self, user_id):
+        """Takes a token from the user's bucket, returning False if it is empty"""
+        now = monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(user_id, (BUCKET_SIZE, now))
+            tokens = min(BUCKET_SIZE, tokens + (now - last) * REFILL_PER_SEC)
+            if tokens < 1:
+                self.buckets[user_id] = (tokens, now)
+                return False
+            self.buckets[user_id] = (tokens - 1, now)
+            return True
+
+    def forget(self, user_id):
+        """Drops a user's bucket once they are no longer playing"""
+        with self.lock:
+            self.buckets.pop(user_id, None)
+            self.throttled.discard(user_id)
+
+    def is_invalid(self, bank, word):
+        """Checks the word against the bank, remembering recent rejections so repeats skip the lookup"""
+        key = (bank.name, word)
+        with self.lock:
+            if key in self.rejected:
+                self.rejected.move_to_end(key)
+                return True
+
+        if bank.is_valid(word):
+            return False
+
+        with self.lock:
+            self.rejected[key] = True
+            if len(self.rejected) > REJECTED_CACHE_SIZE:
+                self.rejected.popitem(last=False)
+        return True
+
+    def reject(self, user_id, word):
+        """Registers an invalid guess, returning True if it opens a new merge window and should be replied to"""
+        with self.lock:
+            if user_id in self.pending_rejections:
+                self.pending_rejections[user_id].append(word)
+                return False
+            self.pending_rejections[user_id] = []
+            return True
+
+    def close_window(self, user_id):
+        """Ends the user's merge window, returning the invalid words guessed during it"""
+        with self.lock:
+            return self.pending_rejections.pop(user_id, [])
+
+    def throttle(self, user_id):
+        """Registers a guess skipped by the bucket, returning True if it opens a new throttle window and should be
+        replied to"""
+        with self.lock:
+            if user_id in self.throttled:
+                return False
+            self.throttled.add(user_id)
+            return True
+
+    def end_throttle(self, user_id):
+        """Ends the user's throttle window, so the next skipped guess is warned about again"""
+        with self.lock:
+            self.throttled.discard(user_id)
+
+
+flood_control = FloodControl()
@@ -1,6 +1,13 @@
+import re
 import telegram.error
+from collections import deque
+from datetime import datetime, timezone
+from threading import Lock
+from admission import admission, MAX_WAITING_LOBBIES, ADMIT_INTERVAL
+from banks import registry, DEFAULT_BANK
 from commands import WordManager
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from floodcontrol import flood_control, INVALID_WORD_MSG, MERGE_WINDOW, THROTTLED_MSG, THROTTLE_WINDOW
+from telegram import Update, User, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CallbackContext
 from telegram.utils import helpers
 
@@ -11,6 +18,7 @@ TIME_LIMIT = 30
 STATUS_INTERVAL = 30
 JOIN_CALLBACK = "join-callback"
 START_LINK = "join-the-game"
+LINK_GROUP = re.compile(r"-?\d+$")
 
 
 # ----------- BOT MANAGER ----------
@@ -19,6 +27,12 @@ class BotManager:
     """Class to manage the simultaneous handling of games in multiple group chats"""
     def __init__(self):
         self.game_managers = []
+        self.group_banks = {}
+        self.draining = False
+        self.waiting_lobbies = deque()
+
+        # Maps each player's user id to their game, so guesses skip the search through every game
+        self.player_games = {}
 
     def new_game(self, update: Update, context: CallbackContext):
         """Adds a new game manager to the list of game managers, then accesses it and starts a game"""
@@ -27,6 +41,11 @@ class BotManager:
             update.message.reply_text("Sorry, you can't start a game when not in a group chat!")
             return
 
+        # Don't start games that would be cut off by the bot restarting
+        if self.draining:
+            update.message.reply_text("Wordle Battle Bot is restarting. Try /startgame again in a minute!")
+            return
+
         # Prevent starting a game if the group chat currently has a game on, unless the game is inactive
         for game in self.game_managers:
             if update.effective_chat.id == game.group_chat_id:
@@ -36,18 +55,131 @@ class BotManager:
                 update.message.reply_text("Sorry, you can't start a game when there is one already running!")
                 return
 
-        game_manager = GameManager()
+        if any(update.effective_chat.id == waiting.effective_chat.id for waiting in self.waiting_lobbies):
+            update.message.reply_text("This group is already in line for a game. Hang tight!")
+            return
+
+        # Queue or turn away the lobby if the bot is saturated
+        self.update_load()
+        decision = admission.admit()
+        if decision == "queue" and len(self.waiting_lobbies) < MAX_WAITING_LOBBIES:
+            self.waiting_lobbies.append(update)
+            update.message.reply_text(f"Wordle Battle Bot is busy right now. Your game will open as soon as "
+                                      f"there's room (you're #{len(self.waiting_lobbies)} in line).")
+            if not context.job_queue.get_jobs_by_name("admit"):
+                context.job_queue.run_repeating(self.admit_waiting, ADMIT_INTERVAL, name="admit")
+            return
+
+        if decision != "accept":
+            update.message.reply_text("Wordle Battle Bot is too busy to start a new game right now. "
+                                      "Please try again in a few minutes!")
+            return
+
+        self.open_lobby(update, context)
+
+    def open_lobby(self, update: Update, context: CallbackContext):
+        """Creates the game manager for a group and invites its members to join"""
+        game_manager = GameManager(bank_name=self.group_banks.get(update.effective_chat.id, DEFAULT_BANK))
         game_manager.start_game(update, context)
 
         # Schedule the game to end automatically after 10 minutes of being started and not begun
-        context.job_queue.run_once(game_manager.timeout, TIMEOUT_SECS, name=f"timeout{game_manager}")
-        context.job_queue.run_once(self.timeout_check, TIMEOUT_SECS + 1, context=game_manager,
-                                   name=f"timeout{game_manager}")
+        self.schedule_timeout(game_manager, context, TIMEOUT_SECS)
 
         # Append to the list of game managers
         self.game_managers.append(game_manager)
+        self.watch(game_manager)
         print(self.game_managers)
 
+    def update_load(self):
+        """Counts the players in running games for the admission controller"""
+        admission.active_players = sum(len(game_manager.current_players) for game_manager in self.game_managers
+                                       if game_manager.game_has_begun and not game_manager.game_has_ended)
+
+    def watch(self, game_manager):
+        """Has the game report eliminations and its end, so the guess lookup and the load stay current"""
+        game_manager.on_elimination = game_manager.on_end = self.forget_players
+
+    def forget_players(self, game_manager, *player_ids):
+        """Removes the given players (or all of an ended game's) from the guess lookup, then recounts the load"""
+        for player_id in player_ids or game_manager.all_player_ids:
+            # Skip players who have since joined another game
+            if self.player_games.get(player_id) is game_manager:
+                del self.player_games[player_id]
+                flood_control.forget(player_id)
+        self.update_load()
+
+    def admit_waiting(self, context: CallbackContext):
+        """Opens waiting lobbies, oldest first, for as long as there is room"""
+        self.update_load()
+        while self.waiting_lobbies and not self.draining and admission.admit() == "accept":
+            self.open_lobby(self.waiting_lobbies.popleft(), context)
+
+        if not self.waiting_lobbies:
+            context.job.schedule_removal()
+
+    def schedule_timeout(self, game_manager, context: CallbackContext, delay):
+        """Schedules a game that has not begun to end after the given number of seconds"""
+        context.job_queue.run_once(game_manager.timeout, delay, name=f"timeout{game_manager}")
+        context.job_queue.run_once(self.timeout_check, delay + 1, context=game_manager,
+                                   name=f"timeout{game_manager}")
+
+    def to_dict(self, job_queue):
+        """Serialises every game still in progress, along with how long each of its timers had left"""
+        return {"group_banks": self.group_banks,
+                "games": [game_manager.to_dict(job_queue) for game_manager in self.game_managers
+                          if not game_manager.game_has_ended],
+                # Groups in line were promised a game, so their /startgame requests carry over too
+                "waiting_lobbies": [update.to_dict() for update in self.waiting_lobbies]}
+
+    def restore(self, data, context: CallbackContext):
+        """Resumes the games serialised by to_dict, rescheduling their timers with the time they had left"""
+        self.group_banks.update({int(chat_id): bank_name for chat_id, bank_name in data["group_banks"].items()})
+
+        for game_data in data["games"]:
+            game_manager = GameManager.from_dict(game_data, context.bot)
+            self.game_managers.append(game_manager)
+            self.watch(game_manager)
+            for player_id in game_manager.current_players:
+                self.player_games[player_id] = game_manager
+
+            if game_manager.game_has_begun:
+                game_manager.resume_timers(game_data["timers"], context)
+            else:
+                self.schedule_timeout(game_manager, context, game_data["timers"].get("timeout", TIMEOUT_SECS))
+
+            game_manager.message_all("Wordle Battle Bot has restarted. Your game has resumed where it left off!",
+                                     context)
+        self.update_load()
+
+        # Put the groups that were waiting back in line, in the same order
+        self.waiting_lobbies.extend(Update.de_json(update, context.bot) for update in data.get("waiting_lobbies", []))
+        if self.waiting_lobbies and not context.job_queue.get_jobs_by_name("admit"):
+            context.job_queue.run_repeating(self.admit_waiting, ADMIT_INTERVAL, name="admit")
+
+    def choose_bank(self, update: Update, context: CallbackContext):
+        """Shows or changes the word bank that the group's future games will use"""
+        if update.effective_chat.type == "private":
+            update.message.reply_text("Word banks can only be chosen in a group chat!")
+            return
+
+        group_chat_id = update.effective_chat.id
+        current = self.group_banks.get(group_chat_id, DEFAULT_BANK)
+
+        if not context.args:
+            update.message.reply_text(f"This group is using the {current} word bank.\n"
+                                      f"Available word banks: {', '.join(registry.available())}\n"
+                                      f"Type /wordbank followed by a name to switch.")
+            return
+
+        bank_name = context.args[0].lower()
+        if not registry.exists(bank_name):
+            update.message.reply_text(f"There is no word bank called {bank_name}. "
+                                      f"Available word banks: {', '.join(registry.available())}")
+            return
+
+        self.group_banks[group_chat_id] = bank_name
+        update.message.reply_text(f"New games in this group will use the {bank_name} word bank.")
+
     def timeout_check(self, context: CallbackContext):
         """Removes a timed out game from the list of game managers after 10 minutes"""
         game_manager = context.job.context
@@ -59,11 +191,20 @@ class BotManager:
             except ValueError:
                 return
 
-    def matching_group(self, update: Update, context: CallbackContext):
+    def matching_group(self, update: Update, context: CallbackContext, group_hint=None):
         """Identifies the index of the game manager which this update should be performed in"""
         current_chat_id = update.effective_chat.id
-        # Check that the current chat id either belongs to a member of the group, or is the group chat id itself
+
+        # Commands sent in the group itself need no membership lookups
         for game_manager in self.game_managers:
+            if current_chat_id == game_manager.group_chat_id:
+                return self.game_managers.index(game_manager)
+
+        # A join link names its group, so only that game's membership is looked up rather than every game's
+        candidates = [game_manager for game_manager in self.game_managers if game_manager.group_chat_id == group_hint]
+
+        # Check that the current chat id either belongs to a member of the group, or is the group chat id itself
+        for game_manager in candidates or self.game_managers:
             bot = context.bot
             try:
                 bot.get_chat_member(game_manager.group_chat_id, current_chat_id)
@@ -77,9 +218,12 @@ class BotManager:
 
     # The following functions search for the matching game and execute the function in the given word manager
     def add_player(self, update: Update, context: CallbackContext):
-        game_index = self.matching_group(update, context)
+        game_index = self.matching_group(update, context, group_hint=link_group(update.callback_query.data))
         if game_index is not None:
-            self.game_managers[game_index].add_player(update, context)
+            game_manager = self.game_managers[game_index]
+            game_manager.add_player(update, context)
+            if update.effective_user.id in game_manager.current_players:
+                self.player_games[update.effective_user.id] = game_manager
 
     def show_players(self, update: Update, context: CallbackContext):
         game_index = self.matching_group(update, context)
@@ -90,13 +234,48 @@ class BotManager:
         game_index = self.matching_group(update, context)
         if game_index is not None:
             self.game_managers[game_index].begin_game(update, context)
+            self.update_load()
 
     def guess_callback(self, update: Update, context: CallbackContext):
-        game_index = self.matching_group(update, context)
-        if game_index is not None:
-            self.game_managers[game_index].guess_callback(update, context)
-            if self.game_managers[game_index].game_has_ended:
-                self.game_managers.pop(game_index)
+        """Fast path for guesses, filtering out messages that don't need the game's attention"""
+        user = update.effective_user
+
+        # Drop messages from users who aren't playing, without searching through the games
+        game_manager = self.player_games.get(user.id)
+        if game_manager is None:
+            return
+
+        # Guesses only count in the player's private chat (whose id is theirs) or in their game's group
+        if update.effective_chat.id not in (user.id, game_manager.group_chat_id):
+            return
+
+        if game_manager.game_has_ended or user.id not in game_manager.current_players:
+            self.player_games.pop(user.id, None)
+            flood_control.forget(user.id)
+            return
+
+        if not game_manager.game_has_begun:
+            return
+
+        # Guesses beyond the player's rate are skipped, with one warning per window so they know to slow down
+        if not flood_control.allow(user.id):
+            if flood_control.throttle(user.id):
+                update.message.reply_text(THROTTLED_MSG)
+                context.job_queue.run_once(end_throttle, THROTTLE_WINDOW, context=user.id, name=f"throttled{user.id}")
+            return
+
+        # Invalid words are answered here, with any more sent shortly after merged into a single reply
+        word = update.message.text.upper()
+        if flood_control.is_invalid(game_manager.bank, word):
+            if flood_control.reject(user.id, word):
+                update.message.reply_text(INVALID_WORD_MSG)
+                context.job_queue.run_once(send_rejections, MERGE_WINDOW, context=(user.id, update.effective_chat.id),
+                                           name=f"rejected{user.id}")
+            return
+
+        game_manager.guess_callback(update, context)
+        if game_manager.game_has_ended and game_manager in self.game_managers:
+            self.game_managers.remove(game_manager)
 
     def force_end(self, update: Update, context: CallbackContext):
         game_index = self.matching_group(update, context)
@@ -110,10 +289,12 @@ class BotManager:
 
 def join(update: Update, context: CallbackContext):
     """After being directed to the private chat"""
+    # Pass the group named in the start link on to the Join button
+    group_id = link_group(context.args[0]) if context.args else None
     update.message.reply_text(
         "⬇️ Click below to join the game ⬇️",
         reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton(text="Join", callback_data=JOIN_CALLBACK)]]
+            [[InlineKeyboardButton(text="Join", callback_data=f"{JOIN_CALLBACK}{group_id or ''}")]]
         ),
     )
     update.message.reply_text(text="Enter /begin once everyone's in the game.")
@@ -123,19 +304,95 @@ def join(update: Update, context: CallbackContext):
 
 class GameManager:
     """Class to manage the start and end of the game, and the players with their individual word managers"""
-    def __init__(self):
+    def __init__(self, bank_name=DEFAULT_BANK):
         self.game_is_on = self.game_has_begun = self.game_has_ended = False
         self.single_player = False
         self.group_chat_id = 0
         self.group_member_ids = []
-        self.current_players = []
         self.all_player_ids = []
         self.word_managers = {}
         self.word_capacity = 0
+        self.bank_name = bank_name
+        self.bank = None
+
+        # Players still in the game, keyed by user id so eliminations are O(1) (dicts keep joining order)
+        self.current_players = {}
+
+        # Wins and losses reported by the word managers, waiting to be acted on
+        self.results = deque()
+        self.results_lock = Lock()
+
+        # Called with the game (and the player) on each elimination and once it ends, so BotManager can let go of
+        # its players and recount the load
+        self.on_elimination = self.on_end = None
 
     def reset(self):
         """Reset the game manager for the next game"""
-        self.__init__()
+        self.__init__(bank_name=self.bank_name)
+
+    def to_dict(self, job_queue):
+        """Serialises the game, including the seconds left on the timeout and each player's drop timer"""
+        timers = {"drop": {}}
+        for job in job_queue.get_jobs_by_name(f"timeout{self}"):
+            if job.callback == self.timeout:
+                timers["timeout"] = seconds_until(job)
+
+        for player in self.current_players.values():
+            for job in job_queue.get_jobs_by_name(f"drop{player.id}"):
+                if job.callback == self.auto_receive:
+                    timers["drop"][player.id] = seconds_until(job)
+
+        players = list(self.word_managers) if self.game_has_begun else list(self.current_players.values())
+        return {"game_is_on": self.game_is_on, "game_has_begun": self.game_has_begun,
+                "single_player": self.single_player, "group_chat_id": self.group_chat_id,
+                "players": [player.to_dict() for player in players],
+                "current_player_ids": list(self.current_players),
+                "all_player_ids": self.all_player_ids, "word_capacity": self.word_capacity,
+                "bank_name": self.bank_name,
+                "used_answers": sorted(self.word_managers[players[0]].used_answers) if self.word_managers else [],
+                "word_managers": {player.id: word_manager.to_dict()
+                                  for player, word_manager in self.word_managers.items()},
+                "timers": timers}
+
+    @classmethod
+    def from_dict(cls, data, bot):
+        """Restores a game serialised by to_dict, without scheduling its timers"""
+        game_manager = cls(bank_name=data["bank_name"])
+        game_manager.game_is_on = data["game_is_on"]
+        game_manager.game_has_begun = data["game_has_begun"]
+        game_manager.single_player = data["single_player"]
+        game_manager.group_chat_id = data["group_chat_id"]
+        game_manager.all_player_ids = data["all_player_ids"]
+        game_manager.word_capacity = data["word_capacity"]
+
+        players = {player["id"]: User.de_json(player, bot) for player in data["players"]}
+        game_manager.current_players = {player_id: players[player_id] for player_id in data["current_player_ids"]}
+
+        if game_manager.game_has_begun:
+            game_manager.bank = registry.acquire(game_manager.bank_name)
+            used_answers = set(data["used_answers"])
+            game_manager.word_managers = {players[int(player_id)]: WordManager.from_dict(word_manager,
+                                                                                         game_manager.bank,
+                                                                                         used_answers)
+                                          for player_id, word_manager in data["word_managers"].items()}
+            for player, word_manager in game_manager.word_managers.items():
+                game_manager.listen(player, word_manager)
+        return game_manager
+
+    def resume_timers(self, timers, context: CallbackContext):
+        """Restarts the status updates and drop timers of a restored game"""
+        for player in self.current_players.values():
+            self.auto_show_status(chat_id=player.id, context=context)
+            self.auto_drop(user=player, context=context, first=timers["drop"].get(str(player.id), TIME_LIMIT))
+
+    def end_game(self):
+        """Marks the game as ended and lets go of its word bank"""
+        self.game_has_ended = True
+        if self.bank is not None:
+            registry.release(self.bank)
+            self.bank = None
+        if self.on_end is not None:
+            self.on_end(self)
 
     def message_all(self, message: str, context: CallbackContext):
         """Helper function for sending a message to everyone in the game"""
@@ -148,7 +405,7 @@ class GameManager:
         self.group_chat_id = update.effective_chat.id
 
         bot = context.bot
-        url = helpers.create_deep_linked_url(bot.username, payload=START_LINK)
+        url = helpers.create_deep_linked_url(bot.username, payload=f"{START_LINK}{self.group_chat_id}")
 
         text = "Welcome to Wordle Battle! Click to join the game, or type /help to learn how to play!"
         keyboard = InlineKeyboardMarkup.from_button(
@@ -168,11 +425,11 @@ class GameManager:
             context.bot.send_message(chat_id=update.effective_chat.id, text="You can't join now, the game has already begun!")
             return
 
-        if user in self.current_players:
+        if user.id in self.current_players:
             context.bot.send_message(chat_id=update.effective_chat.id, text="You're already in the game!")
             return
 
-        self.current_players.append(user)
+        self.current_players[user.id] = user
         self.all_player_ids.append(user.id)
 
         self.message_all(context=context, message=f"{user.name} joined the game.")
@@ -187,12 +444,12 @@ class GameManager:
             context.bot.send_message(chat_id=update.effective_chat.id, text="There is no game currently running.")
 
         elif not self.game_has_begun:
-            players = "Current players: " + ", ".join([player.name for player in self.current_players])
+            players = "Current players: " + ", ".join([player.name for player in self.current_players.values()])
             context.bot.send_message(chat_id=update.effective_chat.id, text=players)
 
         else:
             status = [f"{player.name}: {self.word_managers[player].word_count}/{self.word_capacity}"
-                      for player in self.current_players]
+                      for player in self.current_players.values()]
             context.bot.send_message(chat_id=update.effective_chat.id, text=" ,".join(status))
 
     def begin_game(self, update: Update, context: CallbackContext):
@@ -214,7 +471,13 @@ class GameManager:
         self.game_has_begun = True
 
         self.word_capacity = PLAYER_CAPACITY_RATIO[len(self.all_player_ids)]
-        self.word_managers = {player: WordManager(self.word_capacity) for player in self.current_players}
+        # Every player shares the game's word bank and its set of drawn answers
+        self.bank = registry.acquire(self.bank_name)
+        used_answers = set()
+        self.word_managers = {player: WordManager(self.word_capacity, self.bank, used_answers)
+                              for player in self.current_players.values()}
+        for player, word_manager in self.word_managers.items():
+            self.listen(player, word_manager)
 
         if len(self.current_players) == 1:
             self.single_player = True
@@ -226,11 +489,11 @@ class GameManager:
         self.message_all(message=f"If your stack exceeds more than {self.word_capacity} words, you lose!", context=context)
         self.message_all(message=f"A new word will be added for every 3 guesses you make.", context=context)
 
-        for player in self.current_players:
+        for player in self.current_players.values():
             self.auto_show_status(chat_id=player.id, context=context)
             self.auto_drop(user=player, context=context)
 
-    def auto_drop(self, user, context: CallbackContext):
+    def auto_drop(self, user, context: CallbackContext, first=TIME_LIMIT):
         """This function is called every time a user makes a guess, to reset the queue for blocks to be dropped"""
         # Replaces the current timers if this function is called, i.e. when a new guess is made
         current_jobs = context.job_queue.get_jobs_by_name(f"drop{user.id}")
@@ -238,22 +501,36 @@ class GameManager:
             job.schedule_removal()
 
         # Schedules the auto_receive function for the individual word managers
-        context.job_queue.run_repeating(self.word_managers[user].auto_receive, TIME_LIMIT, context=user.id,
-                                        name=f"drop{user.id}")
+        # (the first drop comes sooner when resuming a timer that was paused partway through)
+        context.job_queue.run_repeating(self.auto_receive, TIME_LIMIT, first=first,
+                                        context=user.id, name=f"drop{user.id}")
 
         # Schedule warning messages to be sent when approaching the time limit
         for i in [0.6666, 0.3333]:
-            context.job_queue.run_repeating(auto_warning, TIME_LIMIT, first=TIME_LIMIT * (1-i),
+            warning_first = first - TIME_LIMIT * i
+            if warning_first <= 0:
+                warning_first += TIME_LIMIT
+            context.job_queue.run_repeating(auto_warning, TIME_LIMIT, first=warning_first,
                                             context=(user.id, TIME_LIMIT * i), name=f"drop{user.id}")
 
-        # Schedules the check_win_lose method to be called on repeat, cancelling all jobs when the player has lost
-        context.job_queue.run_repeating(self.check_win_lose, TIME_LIMIT, name=f"drop{user.id}")
+    def auto_receive(self, context: CallbackContext):
+        """Adds a word to the stack of a player who took too long to guess, then acts on any elimination"""
+        player = self.current_players.get(context.job.context)
+        if player is None:
+            context.job.schedule_removal()
+            return
+
+        self.word_managers[player].auto_receive(context)
+        self.handle_results(context)
 
     def show_status(self, context: CallbackContext):
         """Displays on command how many lives left the opponents have"""
+        # Status broadcasts are the first thing to go when the bot is under pressure
+        if admission.shed():
+            return
 
         status = [f"{player.name}: {self.word_managers[player].word_count}/{self.word_capacity}"
-                  for player in self.current_players]
+                  for player in self.current_players.values()]
 
         chat_id = context.job.context
         context.bot.send_message(chat_id=chat_id, text=", ".join(status))
@@ -272,7 +549,7 @@ class GameManager:
             return
 
         # Do not proceed if the user is not a current player of the game
-        if user not in self.current_players:
+        if user.id not in self.current_players:
             return
 
         # Make a guess and save the return result ("invalid", "normal", "correct_1", "correct_2", "win", "lose")
@@ -282,64 +559,74 @@ class GameManager:
         if guess_result != "invalid":
             self.auto_drop(user=user, context=context)
 
-        # Check for any winners or losers and react accordingly
-        self.check_win_lose(context)
-
         # If correct, make all other players receive blocks (where 'user' is guesser and 'players' is everyone else)
         if guess_result == "correct_1":
-            for player in self.current_players:
+            inherited_answer = self.word_managers[user].answer_to_inherit
+            for player in list(self.current_players.values()):
                 if player != user:
-                    inherited_answer = self.word_managers[user].answer_to_inherit
                     self.word_managers[player].receive_blocks(sender_name=user.name,
                                                               receiver_chat_id=player.id,
                                                               context=context,
                                                               inherit=inherited_answer)
 
-                    # Check for any winners or losers and react accordingly
-                    self.check_win_lose(context)
-
-    def check_win_lose(self, context: CallbackContext):
-        """Called after every time blocks are added/removed to eliminate players or end the game"""
-        for player in self.current_players:
-            if self.word_managers[player].won_game:
-                self.message_all(f"{player.name} has cleared all their words. {player.name} wins!", context)
-                self.message_all(f"The game has ended. Goodbye!", context)
-                for user in self.current_players:
-                    cancel_auto(user, context)
-                self.game_has_ended = True
-                break
-
-            if self.word_managers[player].lost_game:
-                if self.single_player:
-                    self.message_all("You lose!", context)
-                    self.message_all("The game has ended. Goodbye!", context)
-                    self.game_has_ended = True
-
-                else:
-                    self.message_all(f"{player.name} got overwhelmed by words and has been eliminated!", context)
-
-                self.current_players.remove(player)
-                cancel_auto(player, context)
-
-            if not self.single_player:
-                if len(self.current_players) == 1:
-                    winner = self.current_players[0]
-
-                    context.bot.send_message(chat_id=winner.id, text=self.word_managers[winner].win_response())
-                    self.message_all(f"{winner.name} is the last one remaining. {winner.name} wins!", context)
+        # React to any wins or eliminations the guess caused
+        self.handle_results(context)
+
+    def listen(self, player, word_manager):
+        """Queues the word manager's wins and losses, to be acted on by handle_results"""
+        word_manager.on_result = lambda result: self.results.append((player, result))
+
+    def handle_results(self, context: CallbackContext):
+        """Acts once on each win or loss reported since the last call, eliminating players or ending the game"""
+        # Guesses (on the dispatcher thread) and drop timers (on the job queue's threads) both report results, so
+        # one caller at a time acts on them; results reported while another is acting are picked up by its loop
+        with self.results_lock:
+            while self.results and not self.game_has_ended:
+                player, result = self.results.popleft()
+
+                if result == "win":
+                    self.message_all(f"{player.name} has cleared all their words. {player.name} wins!", context)
                     self.message_all(f"The game has ended. Goodbye!", context)
-                    cancel_auto(winner, context)
-                    self.game_has_ended = True
+                    for user in self.current_players.values():
+                        cancel_auto(user, context)
+                    self.end_game()
+
+                elif player.id in self.current_players:
+                    if self.single_player:
+                        self.message_all("You lose!", context)
+                        self.message_all("The game has ended. Goodbye!", context)
+                        self.end_game()
+
+                    else:
+                        self.message_all(f"{player.name} got overwhelmed by words and has been eliminated!", context)
+
+                    del self.current_players[player.id]
+                    cancel_auto(player, context)
+                    if self.on_elimination is not None:
+                        self.on_elimination(self, player.id)
+
+                    if not self.single_player and len(self.current_players) == 1:
+                        winner = next(iter(self.current_players.values()))
+
+                        context.bot.send_message(chat_id=winner.id, text=self.word_managers[winner].win_response())
+                        self.message_all(f"{winner.name} is the last one remaining. {winner.name} wins!", context)
+                        self.message_all(f"The game has ended. Goodbye!", context)
+                        cancel_auto(winner, context)
+                        self.end_game()
+
+            # Once the game is over, nothing left in the queue needs acting on
+            if self.game_has_ended:
+                self.results.clear()
 
     def force_end(self, update: Update, context: CallbackContext):
         """Ends the game on command."""
         user = update.effective_user
-        self.game_has_ended = True
+        self.end_game()
 
         context.bot.send_message(chat_id=self.group_chat_id, text=f"The game was ended by {user.name}. Goodbye!")
         self.message_all(f"The game was ended by {user.name}. Goodbye!", context)
 
-        for user in self.current_players:
+        for user in self.current_players.values():
             cancel_auto(user, context)
 
     def timeout(self, context: CallbackContext):
@@ -347,18 +634,49 @@ class GameManager:
         if not self.game_has_begun and not self.game_has_ended:
             context.bot.send_message(chat_id=self.group_chat_id, text=f"Game ended due to timeout.")
             self.message_all(f"Game ended due to timeout.", context)
-            self.game_has_ended = True
+            self.end_game()
 
 
 # -------- HELPER FUNCTIONS ---------
 
+def link_group(payload):
+    """Returns the group chat id at the end of a start link or Join button payload, if it has one"""
+    match = LINK_GROUP.search(payload or "")
+    return int(match.group()) if match else None
+
+
+def seconds_until(job):
+    """Seconds until a job next runs, or zero if it is already due"""
+    if job.next_t is None:
+        return 0
+    return max(0.0, (job.next_t - datetime.now(timezone.utc)).total_seconds())
+
+
 def auto_warning(context: CallbackContext):
     """Sends a message as a warning of blocks approaching"""
     chat_id, remaining = context.job.context
 
+    # Warnings are non-essential, so they are skipped when the bot is under pressure
+    if admission.shed():
+        return
+
     context.bot.send_message(chat_id=chat_id, text=f"New word arriving in {int(round(remaining))} seconds.")
 
 
+def send_rejections(context: CallbackContext):
+    """Sends one reply for all the invalid words a player guessed since their last invalid word reply"""
+    user_id, chat_id = context.job.context
+
+    words = flood_control.close_window(user_id)
+    if words:
+        context.bot.send_message(chat_id=chat_id, text=f"Also not in the word list: {', '.join(words)}")
+
+
+def end_throttle(context: CallbackContext):
+    """Lets the next guess a player sends too quickly be warned about again"""
+    flood_control.end_throttle(context.job.context)
+
+
 def cancel_auto(user, context: CallbackContext):
     """Cancels any recurring automatic functions from the job queue for a given player"""
     drop_jobs = context.job_queue.get_jobs_by_name(f"drop{user.id}")
@@ -397,6 +715,7 @@ HELP_MSG = '''
 😗 STARTING COMMANDS 😗
 /startgame: Use this command in a group chat to initiate a game. Click the button that follows to join.
 /begin: Use this command to start playing once everyone's in the game.
+/wordbank: Use this command in a group chat to see or change the list of words used in its games.
 
 🧐 MAKING GUESSES 🧐
 When the game begins, each player is assigned a stack of random 5-letter words.
@@ -0,0 +1,159 @@
+"""
+On-demand profiling of the live process.
+A sampling profiler walks every thread's stack at a fixed interval while tracemalloc tracks allocations,
+since handlers and jobs run in worker threads that cProfile (which only profiles its own thread) can't see.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = 0.005
+DEFAULT_SECS = 10
+MAX_SECS = 120
+TOP_N = 8
+TRACEMALLOC_FRAMES = 10
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Frames that sit under every sample of the main thread while it idles, in either mode
+ENTRY_FRAMES = {("bot.py", "main"), ("bot.py", "main_async"), ("aio.py", "run")}
+
+
+# ----------- PROFILER ----------
+
+class Profile:
+    """Result of sampling all threads for a number of seconds"""
+    def __init__(self):
+        self.samples = 0
+        self.stacks = Counter()
+        self.own_time = Counter()
+        self.total_time = Counter()
+        self.snapshot = self.allocations = None
+
+    def add_stack(self, frames):
+        """Counts one sample of a stack, given as a list of (file, function, line) from outermost to innermost"""
+        self.samples += 1
+        self.stacks[";".join(f"{func} ({os.path.basename(file)}:{line})" for file, func, line in frames)] += 1
+        self.own_time[frames[-1]] += 1
+        for frame in set(frames):
+            self.total_time[frame] += 1
+
+    def save(self, directory=PROFILE_DIR):
+        """Writes the collapsed stacks (flame graph format) and the allocation snapshot, returning their paths"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+
+        stacks_path = os.path.join(directory, f"profile-{stamp}.txt")
+        with open(stacks_path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+        snapshot_path = os.path.join(directory, f"alloc-{stamp}.snapshot")
+        self.snapshot.dump(snapshot_path)
+
+        return stacks_path, snapshot_path
+
+    def summary(self, top_n=TOP_N):
+        """Formats the hottest functions of the bot and the top allocation sites"""
+        if not self.samples:
+            return "No bot code was running while profiling."
+
+        def share(count):
+            return f"{100 * count / self.samples:.0f}%"
+
+        # Inclusive time is only shown for the bot's own functions, since library frames would drown them out
+        own_code = [(frame, count) for frame, count in self.total_time.most_common()
+                    if is_own_code(frame[0]) and frame[0] != __file__
+                    and (os.path.basename(frame[0]), frame[1]) not in ENTRY_FRAMES][:top_n]
+
+        msg = f"🔥 PROFILE 🔥\n{self.samples} samples\n\nHot functions (including callees):\n"
+        msg += "\n".join([f"{share(count)} {func} ({os.path.basename(file)}:{line})"
+                          for (file, func, line), count in own_code])
+
+        msg += "\n\nHot spots (self):\n"
+        msg += "\n".join([f"{share(count)} {func} ({os.path.basename(file)}:{line})"
+                          for (file, func, line), count in self.own_time.most_common(top_n)])
+
+        msg += "\n\nTop allocation sites (growth):\n"
+        msg += "\n".join([f"{stat.size_diff / 1024:+.1f} KiB {format_trace(stat.traceback)}"
+                          for stat in self.allocations[:top_n]])
+        return msg
+
+
+def sample(seconds, interval=SAMPLE_INTERVAL):
+    """Samples every thread running bot code for the given number of seconds"""
+    profile = Profile()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    baseline = tracemalloc.take_snapshot()
+
+    own_thread = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            frames = walk(frame)
+            if is_busy(frames):
+                profile.add_stack(frames)
+        time.sleep(interval)
+
+    profile.snapshot = tracemalloc.take_snapshot()
+    profile.allocations = profile.snapshot.compare_to(baseline, "lineno")
+    if started_tracing:
+        tracemalloc.stop()
+    return profile
+
+
+# -------- HELPER FUNCTIONS ---------
+
+def walk(frame):
+    """Returns the frames of a stack from outermost to innermost as (file, function, first line)"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append((code.co_filename, code.co_name, code.co_firstlineno))
+        frame = frame.f_back
+    return frames[::-1]
+
+
+def is_own_code(file):
+    return file.startswith(SOURCE_DIR) and "site-packages" not in file
+
+
+def is_busy(frames):
+    """Whether a stack is running bot code, rather than idling in the main loop or a worker waiting for updates"""
+    # The async mode's event loop waits for work in its selector, under the frames that started the loop
+    if frames and os.path.basename(frames[-1][0]) == "selectors.py":
+        return False
+    return any(is_own_code(file) and (os.path.basename(file), func) not in ENTRY_FRAMES
+               for file, func, line in frames)
+
+
+def format_trace(traceback):
+    frame = traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+# ----------- ADMIN COMMAND ----------
+
+profile_lock = threading.Lock()
+
+
+def run_profile(chat_id, seconds, bot):
+    """Profiles the process in the background, then sends the summary to the chat"""
+    if not profile_lock.acquire(blocking=False):
+        bot.send_message(chat_id=chat_id, text="A profile is already running.")
+        return
+
+    try:
+        profile = sample(seconds)
+        stacks_path, snapshot_path = profile.save()
+        bot.send_message(chat_id=chat_id, text=profile.summary() + f"\n\nSaved to {stacks_path} and {snapshot_path}")
+    finally:
+        profile_lock.release()
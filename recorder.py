@@ -0,0 +1,156 @@
+"""
+Recording of real update traffic for replaying with replay.py.
+Each line of a trace is a JSON object holding the seconds since recording began ("t") and either an update
+("update") or a chat membership the Bot API confirmed ("member", as [chat_id, user_id]).
+Traces are anonymised: user and chat IDs are replaced with stand-ins keyed by RECORD_SALT, names are replaced,
+commands keep only the command itself and any text that isn't a command or a 5-letter guess is redacted.
+Every process recording to the same file (e.g. across Heroku's daily restarts) uses the same stand-ins as long as
+RECORD_SALT stays the same, and carries on from the last time in the file, so the trace reads as one session.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import re
+from threading import Lock
+from time import monotonic
+from telegram import Update
+from telegram.ext import CallbackContext
+from multiplayer import START_LINK, JOIN_CALLBACK
+
+GUESS_PATTERN = re.compile("^[a-zA-Z]{5}$")
+LINK_PATTERN = re.compile(f"({START_LINK}|{JOIN_CALLBACK})(-?\\d+)")
+REDACTED = "[redacted]"
+RECORD_SALT = os.environ.get("RECORD_SALT", "")
+PSEUDONYM_RANGE = 10 ** 10
+TAIL_BYTES = 64 * 1024
+
+# Fields kept for each kind of object; everything else is dropped
+UPDATE_FIELDS = {"update_id", "message", "edited_message", "callback_query"}
+MESSAGE_FIELDS = {"message_id", "date", "chat", "from", "text", "entities", "reply_to_message"}
+CALLBACK_FIELDS = {"id", "from", "message", "chat_instance", "data"}
+
+
+class Recorder:
+    """Appends anonymised updates to a trace file as they arrive"""
+    def __init__(self, path, salt=RECORD_SALT):
+        # Without a fixed salt, each restart would give the same people different stand-ins
+        if not salt:
+            raise ValueError("RECORD_SALT must be set to a secret to record a trace")
+        self.salt = salt.encode()
+        self.start = monotonic() - last_time(path)
+        self.file = open(path, "a")
+        self.members = set()
+        self.lock = Lock()
+
+    def pseudonym(self, real_id):
+        """Maps a real user or chat ID (or chat instance) to a stand-in, keeping group chat IDs negative"""
+        real_id = str(real_id)
+        digest = hmac.new(self.salt, real_id.encode(), hashlib.sha256).digest()
+        number = int.from_bytes(digest[:8], "big") % PSEUDONYM_RANGE + 1
+        return -number if real_id.startswith("-") else number
+
+    def write(self, entry):
+        with self.lock:
+            entry["t"] = round(monotonic() - self.start, 3)
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+
+    def record(self, update: Update, context: CallbackContext):
+        """Handler (registered ahead of all others) which records every update"""
+        data = update.to_dict()
+        if not UPDATE_FIELDS.intersection(data):
+            return
+        with self.lock:
+            anonymised = self.anonymise_update(data)
+        self.write({"update": anonymised})
+
+    def observe_api(self, method, data, result):
+        """Transport listener which records the chat memberships the bot looks up, so replays match them"""
+        if method != "getChatMember":
+            return
+        with self.lock:
+            member = (self.pseudonym(data["chat_id"]), self.pseudonym(data["user_id"]))
+            if member in self.members:
+                return
+            self.members.add(member)
+        self.write({"member": list(member)})
+
+    # ----------- ANONYMISATION ----------
+
+    def anonymise_update(self, data):
+        update = {key: value for key, value in data.items() if key in UPDATE_FIELDS}
+        for key in ("message", "edited_message"):
+            if key in update:
+                update[key] = self.anonymise_message(update[key])
+        if "callback_query" in update:
+            query = {key: value for key, value in update["callback_query"].items() if key in CALLBACK_FIELDS}
+            query["from"] = self.anonymise_user(query["from"])
+            query["chat_instance"] = str(self.pseudonym(query["chat_instance"]))
+            if "data" in query:
+                query["data"] = self.anonymise_links(query["data"])
+            if "message" in query:
+                query["message"] = self.anonymise_message(query["message"])
+            update["callback_query"] = query
+        return update
+
+    def anonymise_message(self, data):
+        message = {key: value for key, value in data.items() if key in MESSAGE_FIELDS}
+        message["date"] = 0
+        message["chat"] = self.anonymise_chat(message["chat"])
+        if "from" in message:
+            message["from"] = self.anonymise_user(message["from"])
+        if "reply_to_message" in message:
+            message["reply_to_message"] = self.anonymise_message(message["reply_to_message"])
+
+        # Only commands and guesses are kept, since those are all the bot reacts to
+        text = message.pop("text", None)
+        entities = message.pop("entities", [])
+        if text is None:
+            return message
+        if GUESS_PATTERN.match(text):
+            message["text"] = text
+        elif text.startswith("/"):
+            # Of anything after the command only a join link is kept, since it may hold free text or mentions
+            command, *arguments = text.split(maxsplit=1)
+            message["text"] = command
+            if arguments and LINK_PATTERN.fullmatch(arguments[0].strip()):
+                message["text"] += " " + self.anonymise_links(arguments[0].strip())
+            if any(entity["type"] == "bot_command" and entity["offset"] == 0 for entity in entities):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        else:
+            message["text"] = REDACTED
+        return message
+
+    def anonymise_links(self, text):
+        """Replaces the group chat ID carried by join links with its stand-in"""
+        return LINK_PATTERN.sub(lambda match: f"{match.group(1)}{self.pseudonym(match.group(2))}", text)
+
+    def anonymise_user(self, data):
+        user_id = self.pseudonym(data["id"])
+        return {"id": user_id, "is_bot": data.get("is_bot", False), "first_name": f"Player{user_id}"}
+
+    def anonymise_chat(self, data):
+        chat_id = self.pseudonym(data["id"])
+        chat = {"id": chat_id, "type": data["type"]}
+        if data["type"] != "private":
+            chat["title"] = f"Group{-chat_id}"
+        return chat
+
+
+# -------- HELPER FUNCTIONS ---------
+
+def last_time(path):
+    """The time of the last entry in an existing trace, so a new process can carry on from it"""
+    if not os.path.exists(path):
+        return 0.0
+    with open(path, "rb") as file:
+        file.seek(max(0, os.path.getsize(path) - TAIL_BYTES))
+        lines = file.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return float(json.loads(line)["t"])
+        except (ValueError, KeyError):
+            continue
+    return 0.0
@@ -0,0 +1,221 @@
+"""
+Replays a trace recorded by recorder.py through the bot's handlers, against the fake Bot API, in virtual time.
+Timers (word drops, warnings, status updates, timeouts) fire at the virtual times they would have,
+so long idle gaps cost nothing when replaying as fast as possible.
+Reports the latency of every handler and job along with the number of calls made to each API method,
+so that two versions of the bot can be compared on the same traffic:
+
+    python replay.py trace.jsonl [--speed 1] [--tail 60] [--seed 0] [--json]
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import queue
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from telegram import Bot, Update
+from telegram.ext import CallbackContext, Dispatcher
+from admission import admission
+from multiplayer import BotManager
+from transport import FakeRequest, LatencyHistogram, FAKE_TOKEN
+import bot
+
+DEFAULT_TAIL = 60
+
+
+# ----------- VIRTUAL JOB QUEUE ----------
+
+class VirtualJob:
+    """Stand-in for telegram.ext.Job that runs on the virtual clock"""
+    def __init__(self, job_queue, callback, when, interval, context, name):
+        self.job_queue = job_queue
+        self.callback = callback
+        self.when = when
+        self.interval = interval
+        self.context = context
+        self.name = name or callback.__name__
+        self.removed = False
+
+    @property
+    def next_t(self):
+        return self.job_queue.to_datetime(self.when)
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+class VirtualJobQueue:
+    """Implements the parts of telegram.ext.JobQueue the bot uses, with time advanced explicitly"""
+    def __init__(self):
+        self.now = 0.0
+        self.epoch = datetime.now(timezone.utc)
+        self.heap = []
+        self.order = itertools.count()
+        self.dispatcher = None
+        self.timings = {}
+
+    def set_dispatcher(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def to_datetime(self, when):
+        return self.epoch + timedelta(seconds=when)
+
+    def _schedule(self, callback, first, interval, context, name):
+        job = VirtualJob(self, callback, self.now + first, interval, context, name)
+        heapq.heappush(self.heap, (job.when, next(self.order), job))
+        return job
+
+    def run_once(self, callback, when, context=None, name=None, **kwargs):
+        return self._schedule(callback, when, None, context, name)
+
+    def run_repeating(self, callback, interval, first=None, context=None, name=None, **kwargs):
+        return self._schedule(callback, interval if first is None else first, interval, context, name)
+
+    def jobs(self):
+        return tuple(job for _, _, job in self.heap if not job.removed)
+
+    def get_jobs_by_name(self, name):
+        return tuple(job for job in self.jobs() if job.name == name)
+
+    def advance_to(self, when, wait=None):
+        """Runs every job due up to the given virtual time, in order, first calling wait with each one's due time"""
+        while self.heap and self.heap[0][0] <= when:
+            due, _, job = heapq.heappop(self.heap)
+            if job.removed:
+                continue
+            if wait is not None:
+                wait(due)
+            self.now = due
+
+            start = time.perf_counter()
+            job.callback(CallbackContext.from_job(job, self.dispatcher))
+            record(self.timings, f"job {getattr(job.callback, '__qualname__', job.name)}", start)
+
+            if job.interval is not None and not job.removed:
+                job.when = due + job.interval
+                heapq.heappush(self.heap, (job.when, next(self.order), job))
+        self.now = max(self.now, when)
+
+
+# ----------- REPLAYER ----------
+
+class Replayer:
+    """Feeds a trace through a freshly built dispatcher and bot manager"""
+    def __init__(self, speed=None, seed=0):
+        self.speed = speed
+        self.wall_start = None
+        random.seed(seed)
+
+        self.request = FakeRequest()
+        self.bot = Bot(FAKE_TOKEN, request=self.request)
+        self.job_queue = VirtualJobQueue()
+        self.dispatcher = Dispatcher(self.bot, queue.Queue(), job_queue=self.job_queue)
+        self.job_queue.set_dispatcher(self.dispatcher)
+        admission.attach(self.dispatcher, self.request)
+
+        self.bot_manager = BotManager()
+        bot.register_handlers(self.dispatcher, self.bot_manager)
+        self.timings = self.job_queue.timings
+        self.time_handlers()
+
+    def time_handlers(self):
+        """Wraps every handler's callback to record how long it takes"""
+        for handlers in self.dispatcher.handlers.values():
+            for handler in handlers:
+                name = f"handler {getattr(handler.callback, '__qualname__', repr(handler.callback))}"
+                handler.callback = timed(handler.callback, name, self.timings)
+
+    def run(self, entries, tail=DEFAULT_TAIL):
+        """Replays the trace entries, then lets timers run for tail more virtual seconds"""
+        # Memberships are looked up while handling updates, so they must all be known beforehand
+        for entry in entries:
+            if "member" in entry:
+                self.request.add_member(*entry["member"])
+
+        # At a set speed, jobs and updates each wait for their own time to come round, so they stay interleaved
+        self.wall_start = time.monotonic()
+        wait = self.wait_until if self.speed else None
+        last_t = 0.0
+        for entry in entries:
+            if "update" not in entry:
+                continue
+            last_t = entry["t"]
+            self.job_queue.advance_to(last_t, wait)
+            if wait is not None:
+                wait(last_t)
+
+            self.dispatcher.process_update(Update.de_json(entry["update"], self.bot))
+
+        self.job_queue.advance_to(last_t + tail, wait)
+        return self.report(time.monotonic() - self.wall_start, last_t + tail)
+
+    def wait_until(self, t):
+        """Sleeps until the given virtual time comes round on the wall clock, at the replay speed"""
+        delay = self.wall_start + t / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def report(self, wall_secs, virtual_secs):
+        """Summarises handler and job latency, and API calls per method"""
+        return {"wall_secs": round(wall_secs, 3), "virtual_secs": virtual_secs,
+                "latency_ms": {name: {"count": histogram.count,
+                                      "mean": round(histogram.total_ms / histogram.count, 3),
+                                      "p95": round(histogram.percentile(0.95), 3),
+                                      "max": round(histogram.max_ms, 3)}
+                               for name, histogram in sorted(self.timings.items())},
+                "api_calls": dict(sorted(self.request.calls.items()))}
+
+
+# -------- HELPER FUNCTIONS ---------
+
+def record(timings, name, start):
+    if name not in timings:
+        timings[name] = LatencyHistogram()
+    timings[name].record((time.perf_counter() - start) * 1000)
+
+
+def timed(callback, name, timings):
+    @wraps(callback)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            record(timings, name, start)
+    return wrapper
+
+
+def load_trace(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def format_report(report):
+    lines = [f"Replayed {report['virtual_secs']:.0f}s of traffic in {report['wall_secs']:.2f}s", "", "Latency (ms):"]
+    lines += [f"  {name}: {stat['count']} calls, mean {stat['mean']:.2f}, p95 ≤{stat['p95']:.2f}, max {stat['max']:.2f}"
+              for name, stat in report["latency_ms"].items()]
+    lines += ["", "API calls:"] + [f"  {method}: {count}" for method, count in report["api_calls"].items()]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded trace through the bot's handlers.")
+    parser.add_argument("trace", help="trace file written by the recorder (RECORD_TRACE)")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="playback speed relative to real time, e.g. 1; 0 replays as fast as possible")
+    parser.add_argument("--tail", type=float, default=DEFAULT_TAIL,
+                        help="virtual seconds to keep running timers after the last update")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, so answer words match between runs")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON for comparing runs")
+    args = parser.parse_args()
+
+    report = Replayer(speed=args.speed, seed=args.seed).run(load_trace(args.trace), tail=args.tail)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
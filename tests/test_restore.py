@@ -0,0 +1,165 @@
+"""
+Saves a game in progress the way a drain does and resumes it in a fresh BotManager, as the next process would,
+checking that each player's stack, hints, guesses and drop timer carry over, and that groups waiting in line for a
+game keep their place.
+"""
+
+import json
+import queue
+import time
+from types import SimpleNamespace
+import pytest
+from telegram import Bot, Update
+from telegram.ext import CallbackContext, Dispatcher, JobQueue
+from admission import admission
+from drain import Drainer, FileStore
+from multiplayer import BotManager, START_LINK, JOIN_CALLBACK, seconds_until
+from transport import FakeRequest, FAKE_TOKEN
+import bot
+
+GROUP = -1001
+PLAYERS = (11, 12)
+DROPS_LEFT = (12, 21)
+
+
+class Process:
+    """One run of the bot, with its handlers registered on a dispatcher that updates are fed to directly"""
+    def __init__(self):
+        self.request = FakeRequest(latency_ms=0)
+        self.bot = Bot(FAKE_TOKEN, request=self.request)
+        self.job_queue = JobQueue()
+        self.dispatcher = Dispatcher(self.bot, queue.Queue(), job_queue=self.job_queue)
+        self.job_queue.set_dispatcher(self.dispatcher)
+        self.job_queue.start()
+        self.bot_manager = BotManager()
+        bot.register_handlers(self.dispatcher, self.bot_manager)
+        self.update_ids = iter(range(1, 10 ** 6))
+
+    def send(self, chat, user_id, text):
+        data = {"message_id": next(self.update_ids), "date": int(time.time()), "chat": chat, "text": text,
+                "from": {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}"}}
+        if text.startswith("/"):
+            data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.dispatcher.process_update(Update.de_json({"update_id": next(self.update_ids), "message": data},
+                                                      self.bot))
+
+    def in_group(self, user_id, text):
+        self.send({"id": GROUP, "type": "group", "title": "Group"}, user_id, text)
+
+    def in_private(self, user_id, text):
+        self.send({"id": user_id, "type": "private", "first_name": f"Player{user_id}"}, user_id, text)
+
+    def join(self, user_id):
+        self.request.add_member(GROUP, user_id)
+        self.in_private(user_id, f"/start {START_LINK}{GROUP}")
+        user = {"id": user_id, "is_bot": False, "first_name": f"Player{user_id}"}
+        message = {"message_id": next(self.update_ids), "date": int(time.time()), "text": "Join",
+                   "chat": {"id": user_id, "type": "private", "first_name": f"Player{user_id}"}}
+        self.dispatcher.process_update(Update.de_json(
+            {"update_id": next(self.update_ids),
+             "callback_query": {"id": str(next(self.update_ids)), "from": user, "message": message,
+                                "chat_instance": str(GROUP), "data": f"{JOIN_CALLBACK}{GROUP}"}}, self.bot))
+
+    def stop(self):
+        self.job_queue.stop()
+
+
+@pytest.fixture
+def processes():
+    started = []
+
+    def start():
+        started.append(Process())
+        return started[-1]
+
+    yield start
+    for process in started:
+        process.stop()
+
+
+def hinting_guess(word_manager):
+    """A valid word that shares a letter with the player's first word but isn't any word in their stack"""
+    answers = [word.answer for word in word_manager.current_words if not word.is_blank]
+    return next(word for word in word_manager.bank.answers if word not in answers and set(word) & set(answers[0]))
+
+
+def drop_timer(job_queue, game_manager, player_id):
+    job = next(job for job in job_queue.get_jobs_by_name(f"drop{player_id}")
+               if job.callback == game_manager.auto_receive)
+    return seconds_until(job)
+
+
+def test_game_survives_save_and_restore(processes, tmp_path):
+    before = processes()
+    before.in_group(PLAYERS[0], "/startgame")
+    for player_id in PLAYERS:
+        before.join(player_id)
+    before.in_group(PLAYERS[0], "/begin")
+
+    # Each player makes a wrong guess sharing letters with their first word, so their stacks pick up hints
+    old_game = before.bot_manager.player_games[PLAYERS[0]]
+    old_managers = {player.id: word_manager for player, word_manager in old_game.word_managers.items()}
+    for player_id in PLAYERS:
+        before.in_private(player_id, hinting_guess(old_managers[player_id]))
+
+    # Part-way through their drop timers, with a different time left for each player
+    for player, seconds_left in zip(old_game.current_players.values(), DROPS_LEFT):
+        old_game.auto_drop(player, CallbackContext(before.dispatcher), first=seconds_left)
+
+    # Drain: freeze the timers, then save through the store
+    before.job_queue.scheduler.pause()
+    store = FileStore(str(tmp_path / "games.json"))
+    Drainer(SimpleNamespace(dispatcher=before.dispatcher), before.bot_manager, store=store).save(
+        before.bot_manager.to_dict(before.job_queue))
+    saved_drops = {player_id: drop_timer(before.job_queue, old_game, player_id) for player_id in PLAYERS}
+    assert list(saved_drops.values()) == pytest.approx(DROPS_LEFT, abs=1)
+
+    after = processes()
+    Drainer(SimpleNamespace(dispatcher=after.dispatcher), after.bot_manager, store=store).restore()
+    assert store.load() is None
+
+    new_game = after.bot_manager.player_games[PLAYERS[0]]
+    assert after.bot_manager.game_managers == [new_game]
+    assert after.bot_manager.player_games[PLAYERS[1]] is new_game
+    assert new_game.group_chat_id == GROUP and new_game.game_has_begun and not new_game.game_has_ended
+    assert list(new_game.current_players) == list(PLAYERS)
+
+    new_managers = {player.id: word_manager for player, word_manager in new_game.word_managers.items()}
+    for player_id in PLAYERS:
+        old, new = old_managers[player_id], new_managers[player_id]
+        assert [word.to_dict() for word in new.current_words] == \
+               json.loads(json.dumps([word.to_dict() for word in old.current_words]))
+        assert (new.recent_guesses, new.guess_count, new.word_count, new.current_results) == \
+               (old.recent_guesses, old.guess_count, old.word_count, old.current_results)
+        assert new.used_answers == old.used_answers
+        assert drop_timer(after.job_queue, new_game, player_id) == pytest.approx(saved_drops[player_id], abs=1)
+        assert new.recent_guesses and any(word.ordered_hints or set(word.green_hints) != {"•"}
+                                          for word in new.current_words)
+
+    # The players still share one set of drawn answers, so neither can be dealt a word the other already has
+    assert new_managers[PLAYERS[0]].used_answers is new_managers[PLAYERS[1]].used_answers
+
+
+def test_waiting_lobbies_survive_save_and_restore(processes, tmp_path, monkeypatch):
+    before = processes()
+    monkeypatch.setattr(admission, "admit", lambda: "queue")
+    before.in_group(PLAYERS[0], "/startgame")
+    assert before.bot_manager.game_managers == [] and len(before.bot_manager.waiting_lobbies) == 1
+
+    store = FileStore(str(tmp_path / "games.json"))
+    Drainer(SimpleNamespace(dispatcher=before.dispatcher), before.bot_manager, store=store).save(
+        before.bot_manager.to_dict(before.job_queue))
+
+    after = processes()
+    Drainer(SimpleNamespace(dispatcher=after.dispatcher), after.bot_manager, store=store).restore()
+    assert [update.effective_chat.id for update in after.bot_manager.waiting_lobbies] == [GROUP]
+    assert after.job_queue.get_jobs_by_name("admit")
+
+    # Once there is room, the lobby opens in the group that asked for it
+    monkeypatch.setattr(admission, "admit", lambda: "accept")
+    after.bot_manager.admit_waiting(CallbackContext.from_job(after.job_queue.get_jobs_by_name("admit")[0],
+                                                             after.dispatcher))
+    assert [game.group_chat_id for game in after.bot_manager.game_managers] == [GROUP]
+    assert not after.bot_manager.waiting_lobbies
+    assert any(int(chat_id) == GROUP and text.startswith("Welcome to Wordle Battle!")
+               for chat_id, text in after.request.sent)
@@ -0,0 +1,87 @@
+"""
+Drives the wins and losses that word managers report through GameManager.handle_results: a player clearing their
+stack, an elimination that leaves the game running, and the last player standing after the others are eliminated.
+"""
+
+from types import SimpleNamespace
+import pytest
+from telegram import User
+from banks import registry, DEFAULT_BANK
+from commands import WordManager
+from multiplayer import GameManager, PLAYER_CAPACITY_RATIO
+
+PLAYERS = (11, 12, 13)
+
+
+class Context:
+    """Just enough of CallbackContext for handle_results, recording what is sent and which timers are cancelled"""
+    def __init__(self):
+        self.sent = []
+        self.cancelled = []
+        self.bot = SimpleNamespace(send_message=lambda chat_id, text: self.sent.append((chat_id, text)))
+        self.job_queue = SimpleNamespace(get_jobs_by_name=lambda name: self.cancelled.append(name) or ())
+
+    def texts(self):
+        return [text for _, text in self.sent]
+
+
+@pytest.fixture
+def game():
+    """A running three-player game, with its eliminations and end recorded"""
+    game_manager = GameManager()
+    game_manager.game_is_on = game_manager.game_has_begun = True
+    game_manager.bank = registry.acquire(DEFAULT_BANK)
+    game_manager.word_capacity = PLAYER_CAPACITY_RATIO[len(PLAYERS)]
+    used_answers = set()
+    for player_id in PLAYERS:
+        player = User(player_id, f"Player{player_id}", False)
+        game_manager.current_players[player_id] = player
+        game_manager.all_player_ids.append(player_id)
+        game_manager.word_managers[player] = WordManager(game_manager.word_capacity, game_manager.bank, used_answers)
+        game_manager.listen(player, game_manager.word_managers[player])
+
+    game_manager.eliminated, game_manager.ended = [], []
+    game_manager.on_elimination = lambda game, player_id: game.eliminated.append(player_id)
+    game_manager.on_end = lambda game: game.ended.append(game)
+    return game_manager
+
+
+def report(game_manager, player_id, result):
+    game_manager.word_managers[game_manager.current_players[player_id]].report_result(result)
+
+
+def test_win_ends_the_game(game):
+    context = Context()
+    report(game, PLAYERS[1], "win")
+    report(game, PLAYERS[0], "lose")
+    game.handle_results(context)
+
+    assert game.game_has_ended and game.ended == [game]
+    assert "Player12 has cleared all their words. Player12 wins!" in context.texts()
+    assert context.texts().count("The game has ended. Goodbye!") == len(PLAYERS)
+    assert {f"drop{player_id}" for player_id in PLAYERS} <= set(context.cancelled)
+
+    # Nothing reported after the win is acted on, and the queue is emptied
+    assert game.eliminated == [] and not game.results
+
+
+def test_elimination_then_last_player_standing(game):
+    context = Context()
+    report(game, PLAYERS[0], "lose")
+    game.handle_results(context)
+
+    assert not game.game_has_ended
+    assert list(game.current_players) == list(PLAYERS[1:]) and game.eliminated == [PLAYERS[0]]
+    assert "Player11 got overwhelmed by words and has been eliminated!" in context.texts()
+    assert "drop11" in context.cancelled and "drop12" not in context.cancelled
+
+    # Eliminating the next player leaves one standing, who wins
+    context = Context()
+    report(game, PLAYERS[1], "lose")
+    game.handle_results(context)
+
+    assert game.game_has_ended and game.ended == [game]
+    assert game.eliminated == [PLAYERS[0], PLAYERS[1]]
+    assert any(chat_id == PLAYERS[2] and text.startswith("You win!") for chat_id, text in context.sent)
+    assert "Player13 is the last one remaining. Player13 wins!" in context.texts()
+    assert not game.results
@@ -0,0 +1,204 @@
+"""
+Transport layer between the bot and the Telegram Bot API.
+PooledRequest sizes the connection pool for the number of worker threads, applies per-method timeouts
+and records a latency histogram for every API method.
+FakeRequest answers API calls in-process, for benchmark.py, replay.py and the tests, which feed it updates directly.
+"""
+
+import json
+import os
+import queue
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from threading import Lock
+from telegram.error import BadRequest
+from telegram.utils.request import Request
+
+WORKERS = int(os.environ.get("WORKERS", "8"))
+POOL_SIZE = int(os.environ.get("API_POOL_SIZE", str(WORKERS + 8)))
+CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("API_READ_TIMEOUT", "5"))
+FAKE_LATENCY_MS = float(os.environ.get("FAKE_LATENCY_MS", "0"))
+FAKE_TOKEN = "123456:fake-token"
+
+# Read timeouts for individual API methods, used when the caller doesn't pass its own
+METHOD_TIMEOUTS = {
+    "sendMessage": 5.0,
+    "getChatMember": 3.0,
+    "answerCallbackQuery": 3.0,
+}
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+SENT_HISTORY = 1000
+
+# Long-polling calls sit open by design, so they don't count towards the outbound backlog
+LONG_POLL_METHODS = {"getUpdates"}
+
+
+# ----------- LATENCY HISTOGRAMS ----------
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of call latencies"""
+    def __init__(self):
+        self.buckets = array("L", [0]) * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total_ms = self.max_ms = 0.0
+
+    def record(self, ms):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket containing the given fraction of calls"""
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return f"{self.count} calls, mean {self.total_ms / self.count:.0f}ms, " \
+               f"p50 ≤{self.percentile(0.5):.0f}ms, p95 ≤{self.percentile(0.95):.0f}ms, max {self.max_ms:.0f}ms"
+
+
+class LatencyRecorder:
+    """Keeps one histogram per API method, along with the number of outbound calls currently in flight"""
+    def __init__(self):
+        self.histograms = {}
+        self.in_flight = 0
+        self.lock = Lock()
+
+    def start(self, method):
+        if method not in LONG_POLL_METHODS:
+            with self.lock:
+                self.in_flight += 1
+        return time.perf_counter()
+
+    def finish(self, method, start):
+        ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            if method not in LONG_POLL_METHODS:
+                self.in_flight -= 1
+            if method not in self.histograms:
+                self.histograms[method] = LatencyHistogram()
+            self.histograms[method].record(ms)
+
+    def summary(self):
+        if not self.histograms:
+            return "No API calls made yet."
+        lines = [f"{method}: {histogram.summary()}" for method, histogram in sorted(self.histograms.items())]
+        return f"In flight: {self.in_flight}\n" + "\n".join(lines)
+
+
+# ----------- REQUEST OBJECTS ----------
+
+class PooledRequest(Request):
+    """Request with a configurable keep-alive connection pool, per-method timeouts and latency histograms"""
+    def __init__(self, con_pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 method_timeouts=None):
+        # Connections in the pool are reused with HTTP and TCP keep-alive, as set up by Request
+        super().__init__(con_pool_size=con_pool_size, connect_timeout=connect_timeout, read_timeout=read_timeout)
+        self.method_timeouts = {**METHOD_TIMEOUTS, **(method_timeouts or {})}
+        self.latency = LatencyRecorder()
+
+        # Callables notified with (method, data, result) after every successful call
+        self.listeners = []
+
+    # PTB warns about custom attributes on its objects, which subclasses like this one rely on
+    __setattr__ = object.__setattr__
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit("/", 1)[-1]
+        if timeout is None:
+            timeout = self.method_timeouts.get(method)
+
+        start = self.latency.start(method)
+        try:
+            result = super().post(url, data, timeout=timeout)
+        finally:
+            self.latency.finish(method, start)
+
+        for listener in self.listeners:
+            listener(method, data, result)
+        return result
+
+
+class FakeRequest(PooledRequest):
+    """In-process stand-in for the Bot API which records calls instead of sending them"""
+    def __init__(self, latency_ms=FAKE_LATENCY_MS, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_ms = latency_ms
+        self.calls = Counter()
+        self.sent = deque(maxlen=SENT_HISTORY)
+        self.updates = queue.Queue()
+        self.members = {}
+        self.message_id = 0
+        self.lock = Lock()
+        self.bot_user = {"id": int(FAKE_TOKEN.split(":")[0]), "is_bot": True,
+                         "first_name": "Wordle Battle Bot", "username": "WordleBattleBot"}
+
+    def push_update(self, update: dict):
+        """Queues an update for getUpdates, remembering which users have been seen in which group chats"""
+        message = update.get("message")
+        if message and message["chat"]["type"] != "private" and "from" in message:
+            self.add_member(message["chat"]["id"], message["from"]["id"])
+        self.updates.put(update)
+
+    def add_member(self, chat_id, user_id):
+        with self.lock:
+            self.members.setdefault(chat_id, set()).add(user_id)
+
+    def _request_wrapper(self, method, url, body=None, **kwargs):
+        # Simulated network latency, so pool sizing and fan-out can be benchmarked
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        api_method = url.rsplit("/", 1)[-1]
+        data = json.loads(body.decode("utf-8")) if body else {}
+        with self.lock:
+            self.calls[api_method] += 1
+
+        handler = getattr(self, f"fake_{api_method}", None)
+        result = handler(data) if handler else True
+        return json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    def fake_getMe(self, data):
+        return self.bot_user
+
+    def fake_sendMessage(self, data):
+        with self.lock:
+            self.message_id += 1
+            message_id = self.message_id
+        self.sent.append((data["chat_id"], data.get("text")))
+
+        chat_id = int(data["chat_id"])
+        return {"message_id": message_id, "date": int(time.time()), "from": self.bot_user, "text": data.get("text"),
+                "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}
+
+    def fake_getChatMember(self, data):
+        chat_id, user_id = int(data["chat_id"]), int(data["user_id"])
+        if user_id not in self.members.get(chat_id, ()):
+            raise BadRequest("User not found")
+        return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": str(user_id)}}
+
+    def fake_getUpdates(self, data):
+        # Block like long polling would, then hand over everything that has arrived
+        try:
+            updates = [self.updates.get(timeout=float(data.get("timeout", 0)) or 0.1)]
+        except queue.Empty:
+            return []
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return [update for update in updates if update.get("update_id", 0) >= int(data.get("offset", 0))]
+
+
+def make_request():
+    """Creates the request object that the bot will send all API calls through"""
+    return PooledRequest()